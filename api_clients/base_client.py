@@ -1,10 +1,12 @@
 # api_clients/base_client.py
+import contextlib
 import requests
 import time
 import json
 from datetime import datetime, timedelta, timezone
 from bs4 import BeautifulSoup
 import re
+import functools
 from urllib.parse import urlparse
 
 from core.config import (
@@ -12,13 +14,14 @@ from core.config import (
     CACHE_EXPIRY_SECONDS
 )
 from core.logging_setup import logger
-from database.connection import SessionLocal
+from database.connection import SessionFactory
 from database.models import CachedAPIData
 
 
 class APIClient:
-    def __init__(self, base_url, api_key_name=None, api_key_value=None, headers=None):
+    def __init__(self, base_url, api_key_name=None, api_key_value=None, headers=None, rate_limiter=None):
         self.base_url = base_url
+        self.rate_limiter = rate_limiter  # Optional shared TokenBucketLimiter, applied to every HTTP attempt
         self.api_key_name = api_key_name
         self.api_key_value = api_key_value
         self.headers = headers or {}
@@ -28,7 +31,9 @@ class APIClient:
             self.params = {}
 
     def _get_cached_response(self, request_url_or_params_str):
-        session = SessionLocal()
+        # A private (non-scoped) session: SessionLocal() would hand back, and then close/commit,
+        # the calling worker thread's own session and detach its objects mid-task.
+        session = SessionFactory()
         try:
             current_time_utc = datetime.now(timezone.utc)
             cache_entry = session.query(CachedAPIData).filter(
@@ -44,11 +49,11 @@ class APIClient:
             session.close()
         return None
 
-    def _cache_response(self, request_url_or_params_str, response_data, api_source):
-        session = SessionLocal()
+    def _cache_response(self, request_url_or_params_str, response_data, api_source, expiry_seconds=None):
+        session = SessionFactory()  # Private session, see _get_cached_response
         try:
             now_utc = datetime.now(timezone.utc)
-            expires_at_utc = now_utc + timedelta(seconds=CACHE_EXPIRY_SECONDS)
+            expires_at_utc = now_utc + timedelta(seconds=expiry_seconds or CACHE_EXPIRY_SECONDS)
 
             session.query(CachedAPIData).filter(
                 CachedAPIData.request_url_or_params == request_url_or_params_str).delete(synchronize_session=False)
@@ -70,7 +75,7 @@ class APIClient:
             session.close()
 
     def request(self, method, endpoint, params=None, data=None, json_data=None, use_cache=True,
-                api_source_name="unknown", is_json_response=True):
+                api_source_name="unknown", is_json_response=True, cache_expiry_seconds=None):
 
         # Determine if endpoint is a full URL
         parsed_endpoint = urlparse(endpoint)
@@ -106,21 +111,22 @@ class APIClient:
 
         for attempt in range(API_RETRY_ATTEMPTS):
             try:
-                response = requests.request(
-                    method, url, params=full_query_params, data=data, json=json_data,
-                    headers=self.headers, timeout=API_REQUEST_TIMEOUT
-                )
+                with self.rate_limiter or contextlib.nullcontext():
+                    response = requests.request(
+                        method, url, params=full_query_params, data=data, json=json_data,
+                        headers=self.headers, timeout=API_REQUEST_TIMEOUT
+                    )
                 response.raise_for_status()
 
                 if not is_json_response:
                     response_content = response.text
                     if use_cache:
-                        self._cache_response(cache_key_str, response_content, api_source_name)
+                        self._cache_response(cache_key_str, response_content, api_source_name, cache_expiry_seconds)
                     return response_content
 
                 response_json = response.json()
                 if use_cache:
-                    self._cache_response(cache_key_str, response_json, api_source_name)
+                    self._cache_response(cache_key_str, response_json, api_source_name, cache_expiry_seconds)
                 return response_json
 
             except requests.exceptions.HTTPError as e:
@@ -273,7 +279,43 @@ def scrape_article_content(url):
         return None
 
 
-def extract_S1_text_sections(filing_text, sections_map):
+# Cleanup patterns for extract_S1_text_sections, compiled once at import rather than looked up per section
+_LINE_BREAK_SPACING_RE = re.compile(r'\s*\n\s*')
+_EXTRA_BLANK_LINES_RE = re.compile(r'\n{3,}')
+_TOC_LINE_RE = re.compile(r'(?i)\btable\s+of\s+contents\b.*?\n', re.MULTILINE)
+_PAGE_MARKER_LINE_RE = re.compile(r'^\s*(?:Page\s+\d+|\d+|PART\s+[IVXLCDM]+)\s*$', re.MULTILINE)
+
+
+@functools.lru_cache(maxsize=16)
+def _compile_section_headers_regex(sections_items):
+    """
+    Builds the section-header regex for a sections map once per process (maps are module constants in config).
+    All header patterns are alternatives of one regex, so the filing text is scanned once instead of once per pattern.
+    Returns (compiled regex, {group name: section key}).
+    """
+    header_alternatives, group_keys = [], {}
+    for key, patterns_list in sections_items:
+        item_num_pattern_str = patterns_list[0].replace('.', r'\.?')
+        base_item_regex = r"(?:ITEM|Item)\s*" + item_num_pattern_str.split()[-1] + r"\.?\s*:?\s*"
+        if len(patterns_list) > 1:
+            descriptive_name_regex = re.escape(patterns_list[1])
+            key_regexes = [base_item_regex + descriptive_name_regex, r"^\s*" + descriptive_name_regex + r"\s*$"]
+        else:
+            key_regexes = [base_item_regex]
+        for regex_str in key_regexes:
+            group_name = f"h{len(header_alternatives)}"
+            group_keys[group_name] = key
+            header_alternatives.append(f"(?P<{group_name}>{regex_str})")
+    # MULTILINE only affects the anchored descriptive-name-only alternatives
+    return re.compile("|".join(header_alternatives), re.IGNORECASE | re.MULTILINE), group_keys
+
+
+def extract_S1_text_sections(filing_text, sections_map, max_section_chars=None):
+    """
+    max_section_chars caps each section's raw span before cleanup, so callers that only need a prefix
+    don't pay for copying and regex-cleaning multi-megabyte sections. Candidates for the same section are
+    then compared by uncapped span length instead of cleaned length.
+    """
     if not filing_text or not sections_map: return {}
     extracted_sections = {}
     try:
@@ -285,7 +327,7 @@ def extract_S1_text_sections(filing_text, sections_map):
         except Exception as e_bs_parse:
             logger.error(
                 f"BeautifulSoup failed to parse filing text with lxml and html.parser: {e_bs_parse}. Using raw text and regex matching might be less accurate.")
-            normalized_text = re.sub(r'\s*\n\s*', '\n', filing_text.strip())
+            normalized_text = _LINE_BREAK_SPACING_RE.sub('\n', filing_text.strip())
             normalized_text = ''.join(filter(lambda x: x.isprintable() or x.isspace(), normalized_text))
             soup = None
 
@@ -300,35 +342,20 @@ def extract_S1_text_sections(filing_text, sections_map):
             if text:
                 page_text.append(text)
         normalized_text = '\n\n'.join(page_text)
-        normalized_text = re.sub(r'\s*\n\s*', '\n', normalized_text)
-        normalized_text = re.sub(r'\n{3,}', '\n\n', normalized_text)
+        normalized_text = _LINE_BREAK_SPACING_RE.sub('\n', normalized_text)
+        normalized_text = _EXTRA_BLANK_LINES_RE.sub('\n\n', normalized_text)
         normalized_text = ''.join(filter(lambda x: x.isprintable() or x.isspace(), normalized_text))
     else:  # soup is None, normalized_text was already prepared
         pass
 
-    section_patterns = []
-    for key, patterns_list in sections_map.items():
-        item_num_pattern_str = patterns_list[0].replace('.', r'\.?')
-        base_item_regex = r"(?:ITEM|Item)\s*" + item_num_pattern_str.split()[-1] + r"\.?\s*:?\s*"
-        if len(patterns_list) > 1:
-            descriptive_name_regex = re.escape(patterns_list[1])
-            start_regex_str_item_desc = base_item_regex + descriptive_name_regex
-            section_patterns.append({"key": key, "start_regex": re.compile(start_regex_str_item_desc, re.IGNORECASE)})
-            start_regex_str_desc_only = r"^\s*" + descriptive_name_regex + r"\s*$"
-            section_patterns.append(
-                {"key": key, "start_regex": re.compile(start_regex_str_desc_only, re.IGNORECASE | re.MULTILINE)})
-        else:
-            section_patterns.append({"key": key, "start_regex": re.compile(base_item_regex, re.IGNORECASE)})
-
-    found_sections_matches = []
-    for pattern_info in section_patterns:
-        for match in pattern_info["start_regex"].finditer(normalized_text):
-            found_sections_matches.append({
-                "key": pattern_info["key"],
-                "start": match.start(),
-                "end_of_header": match.end(),
-                "header_text": match.group(0).strip()
-            })
+    headers_regex, group_keys = _compile_section_headers_regex(
+        tuple((key, tuple(patterns_list)) for key, patterns_list in sections_map.items()))
+    found_sections_matches = [{
+        "key": group_keys[match.lastgroup],
+        "start": match.start(),
+        "end_of_header": match.end(),
+        "header_text": match.group(0).strip()
+    } for match in headers_regex.finditer(normalized_text)]
 
     if not found_sections_matches:
         logger.warning("No sections extracted from SEC filing based on ITEM X or descriptive name patterns.");
@@ -336,6 +363,7 @@ def extract_S1_text_sections(filing_text, sections_map):
 
     found_sections_matches.sort(key=lambda x: x["start"])
 
+    best_span_lengths = {}  # Only used with max_section_chars
     for i, current_sec_info in enumerate(found_sections_matches):
         start_index = current_sec_info["end_of_header"]
         end_index = len(normalized_text)
@@ -349,15 +377,21 @@ def extract_S1_text_sections(filing_text, sections_map):
                 # For now, any different key means end of current section.
                 end_index = next_sec_info["start"]
                 break
+        span_length = end_index - start_index
+        if max_section_chars:
+            if span_length <= best_span_lengths.get(current_sec_info["key"], -1):
+                continue  # A longer candidate for this section was already taken
+            end_index = min(end_index, start_index + max_section_chars)
         section_text = normalized_text[start_index:end_index].strip()
-        section_text = re.sub(r'(?i)\btable\s+of\s+contents\b.*?\n', '', section_text, flags=re.MULTILINE)
-        section_text = re.sub(r'^\s*(?:Page\s+\d+|\d+|PART\s+[IVXLCDM]+)\s*$', '', section_text, flags=re.MULTILINE)
-        section_text = re.sub(r'\n{3,}', '\n\n', section_text).strip()
+        section_text = _TOC_LINE_RE.sub('', section_text)
+        section_text = _PAGE_MARKER_LINE_RE.sub('', section_text)
+        section_text = _EXTRA_BLANK_LINES_RE.sub('\n\n', section_text).strip()
 
         if section_text:
-            if current_sec_info["key"] not in extracted_sections or len(section_text) > len(
+            if max_section_chars or current_sec_info["key"] not in extracted_sections or len(section_text) > len(
                     extracted_sections.get(current_sec_info["key"], "")):
                 extracted_sections[current_sec_info["key"]] = section_text
+                best_span_lengths[current_sec_info["key"]] = span_length
                 logger.debug(
                     f"Extracted section '{current_sec_info['key']}' (header: '{current_sec_info['header_text']}') len {len(section_text)}")
 
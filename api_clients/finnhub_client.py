@@ -1,11 +1,13 @@
 from datetime import datetime, timedelta, timezone
 from .base_client import APIClient
-from core.config import FINNHUB_API_KEY
+from .rate_limiter import FINNHUB_LIMITER
+from core.config import FINNHUB_API_KEY, FINNHUB_IPO_CALENDAR_CACHE_EXPIRY_SECONDS
 
 
 class FinnhubClient(APIClient):
     def __init__(self):
-        super().__init__("https://finnhub.io/api/v1", api_key_name="token", api_key_value=FINNHUB_API_KEY)
+        super().__init__("https://finnhub.io/api/v1", api_key_name="token", api_key_value=FINNHUB_API_KEY,
+                         rate_limiter=FINNHUB_LIMITER)
 
     def get_market_news(self, category="general", min_id=0):
         params = {"category": category}
@@ -28,7 +30,8 @@ class FinnhubClient(APIClient):
         if from_date is None: from_date = (datetime.now(timezone.utc) - timedelta(days=30)).strftime('%Y-%m-%d')
         if to_date is None: to_date = (datetime.now(timezone.utc) + timedelta(days=90)).strftime('%Y-%m-%d')
         params = {"from": from_date, "to": to_date}
-        return self.request("GET", "/calendar/ipo", params=params, api_source_name="finnhub_ipo_calendar")
+        return self.request("GET", "/calendar/ipo", params=params, api_source_name="finnhub_ipo_calendar",
+                            cache_expiry_seconds=FINNHUB_IPO_CALENDAR_CACHE_EXPIRY_SECONDS)
 
     def get_sec_filings(self, ticker, from_date=None, to_date=None):
         if from_date is None: from_date = (datetime.now(timezone.utc) - timedelta(days=365 * 2)).strftime('%Y-%m-%d')
@@ -2,19 +2,37 @@
 import requests
 import time
 import json
+import hashlib
+import threading
 
 from core.config import (
     GOOGLE_API_KEYS, API_REQUEST_TIMEOUT, API_RETRY_ATTEMPTS,
     API_RETRY_DELAY, GEMINI_PROMPT_MAX_CHARS_HARD_TRUNCATE,
-    GEMINI_MODEL_NAME, AI_JSON_OUTPUT_INSTRUCTION, GEMINI_MAX_OUTPUT_TOKENS
+    GEMINI_MODEL_NAME, AI_JSON_OUTPUT_INSTRUCTION, GEMINI_MAX_OUTPUT_TOKENS,
+    GEMINI_RESPONSE_CACHE_EXPIRY_SECONDS
 )
 from core.logging_setup import logger
+from .base_client import APIClient
+from .rate_limiter import GEMINI_LIMITER
 
 
-class GeminiAPIClient:
+class GeminiAPIClient(APIClient):
+    # Subclasses APIClient for its CachedAPIData helpers; generateContent calls are made directly below
     def __init__(self):
-        self.base_url = "https://generativelanguage.googleapis.com/v1beta/models"
+        super().__init__("https://generativelanguage.googleapis.com/v1beta/models", rate_limiter=GEMINI_LIMITER)
         self.model_name = GEMINI_MODEL_NAME
+        # One keep-alive requests.Session per worker thread (Sessions aren't guaranteed thread-safe): each thread
+        # pays one TLS handshake, then reuses its connection for every generateContent call. See _get_session.
+        self._thread_local = threading.local()
+        # Keys rejected as API_KEY_INVALID stay skipped for this client's lifetime (shared by all its worker threads),
+        # so later prompts don't spend a request and a retry delay on each dead key again
+        self._invalid_api_keys = set()
+
+    def _get_session(self):
+        session = getattr(self._thread_local, "session", None)
+        if session is None:
+            session = self._thread_local.session = requests.Session()
+        return session
 
     def _get_next_api_key_for_attempt(self, overall_attempt_num, max_attempts_per_key, total_keys):
         if total_keys == 0: return None, 0
@@ -56,7 +74,11 @@ class GeminiAPIClient:
 
         return cleaned_str
 
-    def generate_text(self, prompt, model=None, output_format="text"):
+    def generate_text(self, prompt, model=None, output_format="text", use_cache=True, response_schema=None):
+        """
+        response_schema (json output only): Gemini responseSchema (OpenAPI subset, e.g. {"type": "OBJECT", ...}).
+        The model is then constrained to return exactly that structure.
+        """
         if model is None: model = self.model_name
 
         max_attempts_per_key = API_RETRY_ATTEMPTS
@@ -83,11 +105,28 @@ class GeminiAPIClient:
             else:
                 final_prompt = final_prompt[:GEMINI_PROMPT_MAX_CHARS_HARD_TRUNCATE - len(trunc_note)] + trunc_note
 
+        # Identical prompts (re-runs, retried pipelines) reuse the stored response; only successes are cached.
+        # Whitespace is normalized for the key so layout-only differences in extracted filing text still hit.
+        normalized_prompt = " ".join(final_prompt.split())
+        if response_schema and output_format == "json":
+            normalized_prompt += f"\0{json.dumps(response_schema, sort_keys=True)}"  # Different schema, different output
+        prompt_hash = hashlib.sha256(normalized_prompt.encode("utf-8", errors="replace")).hexdigest()
+        cache_key_str = f"GEMINI:{model}:{output_format}:{prompt_hash}"
+        if use_cache:
+            cached_output = self._get_cached_response(cache_key_str)
+            if cached_output is not None:
+                return cached_output
+
+        if len(self._invalid_api_keys) >= total_keys:
+            logger.error("Gemini: every configured API key was rejected as invalid earlier in this run. Skipping call.")
+            return {"error": "All Gemini API keys invalid."} if output_format == "json" else "Error: All Gemini API keys invalid."
+
         for overall_attempt_num in range(total_keys * max_attempts_per_key):
             api_key, current_retry_for_this_key = self._get_next_api_key_for_attempt(
                 overall_attempt_num, max_attempts_per_key, total_keys
             )
             if api_key is None: break
+            if api_key in self._invalid_api_keys: continue
 
             url = f"{self.base_url}/{model}:generateContent?key={api_key}"
             payload = {
@@ -96,7 +135,6 @@ class GeminiAPIClient:
                     "temperature": 0.5,  # Slightly lower for more factual JSON
                     "maxOutputTokens": GEMINI_MAX_OUTPUT_TOKENS,
                     "topP": 0.9, "topK": 40,
-                    # "response_mime_type": "application/json" # Add if using models that support this directly
                 },
                 "safetySettings": [
                     {"category": "HARM_CATEGORY_HARASSMENT", "threshold": "BLOCK_MEDIUM_AND_ABOVE"},
@@ -105,13 +143,17 @@ class GeminiAPIClient:
                     {"category": "HARM_CATEGORY_DANGEROUS_CONTENT", "threshold": "BLOCK_MEDIUM_AND_ABOVE"},
                 ]
             }
-            # If the model supports it, setting response_mime_type in generationConfig
-            # if output_format == "json" and model_supports_json_output: # model_supports_json_output would be a flag
-            #    payload["generationConfig"]["response_mime_type"] = "application/json"
+            if output_format == "json":
+                # JSON mode: the model returns a bare JSON document (no markdown fences or prose), so json.loads
+                # succeeds first time; _clean_json_string below stays as a fallback for models that ignore it
+                payload["generationConfig"]["responseMimeType"] = "application/json"
+                if response_schema:
+                    payload["generationConfig"]["responseSchema"] = response_schema
 
             try:
-                response = requests.post(url, json=payload,
-                                         timeout=API_REQUEST_TIMEOUT + 120)  # Increased timeout for potentially larger JSON
+                with self.rate_limiter:  # Shared QPM budget + in-flight cap across worker threads
+                    response = self._get_session().post(url, json=payload,
+                                                         timeout=API_REQUEST_TIMEOUT + 120)  # Increased timeout for potentially larger JSON
                 response.raise_for_status()
                 response_json = response.json()
 
@@ -142,7 +184,7 @@ class GeminiAPIClient:
                         if output_format == "json":
                             cleaned_json_str = self._clean_json_string(raw_text_output)
                             try:
-                                return json.loads(cleaned_json_str)
+                                parsed_json_output = json.loads(cleaned_json_str)
                             except json.JSONDecodeError as e_json_parse:
                                 logger.error(
                                     f"Gemini response for key ...{api_key[-4:]} was not valid JSON after cleaning: {e_json_parse}. Raw text: '{raw_text_output[:500]}...'")
@@ -153,7 +195,14 @@ class GeminiAPIClient:
                                     continue
                                 return {"error": "Failed to parse AI JSON response", "details": str(e_json_parse),
                                         "raw_response": raw_text_output[:500]}
+                            if use_cache:
+                                self._cache_response(cache_key_str, parsed_json_output, "gemini",
+                                                     GEMINI_RESPONSE_CACHE_EXPIRY_SECONDS)
+                            return parsed_json_output
                         else:  # output_format == "text"
+                            if use_cache:
+                                self._cache_response(cache_key_str, raw_text_output, "gemini",
+                                                     GEMINI_RESPONSE_CACHE_EXPIRY_SECONDS)
                             return raw_text_output
                     else:
                         logger.error(
@@ -170,9 +219,8 @@ class GeminiAPIClient:
                 if e.response is not None and e.response.status_code == 400:
                     if "API key not valid" in e.response.text or "API_KEY_INVALID" in e.response.text:
                         logger.error(
-                            f"Gemini API key ...{api_key[-4:]} reported as invalid. Skipping further retries with this key for this call.")
-                        overall_attempt_num = ((
-                                                           overall_attempt_num // max_attempts_per_key) + 1) * max_attempts_per_key - 1  # Advance to next key group
+                            f"Gemini API key ...{api_key[-4:]} reported as invalid. Skipping this key for the rest of the run.")
+                        self._invalid_api_keys.add(api_key)
                         continue
                     else:  # Other 400 errors
                         logger.error(
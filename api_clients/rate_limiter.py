@@ -0,0 +1,55 @@
+# api_clients/rate_limiter.py
+import threading
+import time
+
+from core.config import (
+    SEC_EDGAR_MAX_REQUESTS_PER_SECOND, GEMINI_MAX_REQUESTS_PER_MINUTE, GEMINI_MAX_CONCURRENT_REQUESTS,
+    FINNHUB_MAX_REQUESTS_PER_MINUTE
+)
+
+
+class TokenBucketLimiter:
+    """
+    Thread-safe token bucket shared by every caller of one external service.
+    `with limiter:` blocks until a token is available (and, if max_concurrent is set, until an
+    in-flight slot frees up), so worker threads share one request budget instead of each sleeping.
+    """
+
+    def __init__(self, rate, per_seconds=1.0, max_concurrent=None):
+        self.capacity = float(rate)
+        self.refill_per_second = rate / per_seconds
+        self._tokens = self.capacity
+        self._last_refill = time.monotonic()
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(max_concurrent) if max_concurrent else None
+
+    def acquire(self):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._last_refill) * self.refill_per_second)
+                self._last_refill = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait_seconds = (1 - self._tokens) / self.refill_per_second
+            time.sleep(wait_seconds)  # Sleep outside the lock so other threads can refill/check
+
+    def __enter__(self):
+        if self._slots: self._slots.acquire()
+        try:
+            self.acquire()
+        except BaseException:
+            if self._slots: self._slots.release()
+            raise
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if self._slots: self._slots.release()
+        return False
+
+
+# One budget per service, shared across all client instances and worker threads
+SEC_EDGAR_LIMITER = TokenBucketLimiter(SEC_EDGAR_MAX_REQUESTS_PER_SECOND, 1.0)
+GEMINI_LIMITER = TokenBucketLimiter(GEMINI_MAX_REQUESTS_PER_MINUTE, 60.0, max_concurrent=GEMINI_MAX_CONCURRENT_REQUESTS)
+FINNHUB_LIMITER = TokenBucketLimiter(FINNHUB_MAX_REQUESTS_PER_MINUTE, 60.0)
@@ -1,45 +1,68 @@
 import requests
 import json
+import hashlib
+import threading
+from collections import OrderedDict
 from datetime import datetime
 
-from .base_client import APIClient
-from core.config import EDGAR_USER_AGENT, API_REQUEST_TIMEOUT
+from .base_client import APIClient, extract_S1_text_sections
+from .rate_limiter import SEC_EDGAR_LIMITER
+from core.config import (
+    EDGAR_USER_AGENT, API_REQUEST_TIMEOUT,
+    SEC_FILING_TEXT_CACHE_EXPIRY_SECONDS, SEC_CIK_MAP_CACHE_EXPIRY_SECONDS
+)
 from core.logging_setup import logger
 
+_SECTIONS_MEMO_MAX_ENTRIES = 32  # Extracted-section dicts kept in process, most recently used last
+
 
 class SECEDGARClient(APIClient):
+    # Shared by all client instances/threads: retries and re-analyses within one run skip the DB cache round-trip
+    _sections_memo = OrderedDict()
+    _sections_memo_lock = threading.Lock()
+    # Ticker -> CIK map (~10k entries) loaded once per process rather than once per client instance
+    _cik_map = None
+    _cik_map_lock = threading.Lock()
+
     def __init__(self):
         self.company_tickers_url = "https://www.sec.gov/files/company_tickers.json"
-        super().__init__("https://data.sec.gov/submissions/")
+        super().__init__("https://data.sec.gov/submissions/", rate_limiter=SEC_EDGAR_LIMITER)
         self.headers = {"User-Agent": EDGAR_USER_AGENT, "Accept-Encoding": "gzip, deflate"}
-        self._cik_map = None
         self._archives_base = "https://www.sec.gov/Archives/edgar/data/"
 
     def _load_cik_map(self):
-        if self._cik_map is None:
+        # Double-checked under a lock: concurrent IPO workers wait for one load instead of each fetching the map
+        if SECEDGARClient._cik_map is not None:
+            return SECEDGARClient._cik_map
+        with SECEDGARClient._cik_map_lock:
+            if SECEDGARClient._cik_map is not None:
+                return SECEDGARClient._cik_map
+
             logger.info("Fetching CIK map from SEC...")
             cache_key_str = f"GET:{self.company_tickers_url}"
             cached_map = self._get_cached_response(cache_key_str)
             if cached_map:
-                self._cik_map = cached_map
-                logger.info(f"CIK map loaded from cache with {len(self._cik_map)} entries.")
-                return self._cik_map
+                SECEDGARClient._cik_map = cached_map
+                logger.info(f"CIK map loaded from cache with {len(cached_map)} entries.")
+                return cached_map
 
             try:
-                response = requests.get(self.company_tickers_url, headers=self.headers, timeout=API_REQUEST_TIMEOUT)
+                with self.rate_limiter:
+                    response = requests.get(self.company_tickers_url, headers=self.headers, timeout=API_REQUEST_TIMEOUT)
                 response.raise_for_status()
                 data = response.json()
-                self._cik_map = {item['ticker']: str(item['cik_str']).zfill(10)
-                                 for item in data.values() if 'ticker' in item and 'cik_str' in item}
-                self._cache_response(cache_key_str, self._cik_map, "sec_cik_map")
-                logger.info(f"CIK map fetched and cached with {len(self._cik_map)} entries.")
+                cik_map = {item['ticker']: str(item['cik_str']).zfill(10)
+                           for item in data.values() if 'ticker' in item and 'cik_str' in item}
+                self._cache_response(cache_key_str, cik_map, "sec_cik_map", SEC_CIK_MAP_CACHE_EXPIRY_SECONDS)
+                SECEDGARClient._cik_map = cik_map
+                logger.info(f"CIK map fetched and cached with {len(cik_map)} entries.")
+                return cik_map
+            # Failures aren't kept process-wide, so a later lookup retries the download
             except requests.exceptions.RequestException as e:
                 logger.error(f"Error fetching CIK map from SEC: {e}", exc_info=True)
-                self._cik_map = {}
             except json.JSONDecodeError as e_json:
                 logger.error(f"Error decoding CIK map JSON from SEC: {e_json}", exc_info=True)
-                self._cik_map = {}
-        return self._cik_map
+            return {}
 
     def get_cik_by_ticker(self, ticker):
         ticker = ticker.upper()
@@ -56,7 +79,13 @@ class SECEDGARClient(APIClient):
         return self.request("GET", f"CIK{formatted_cik_for_api}.json", api_source_name="edgar_filings_summary")
 
     def get_filing_document_url(self, cik, form_type="10-K", priordate_str=None, count=1):
+        """
+        form_type may also be a sequence of forms in priority order, e.g. ("S-1", "S-1/A"): the submissions
+        document is scanned once and the filings of the first form type that has any match are returned.
+        """
         if not cik: return None if count == 1 else []
+        form_priority = [form_type.upper()] if isinstance(form_type, str) else [f.upper() for f in form_type]
+        form_label = "/".join(form_priority)
         company_summary = self.get_company_filings_summary(cik)
 
         if not company_summary or "filings" not in company_summary or "recent" not in company_summary["filings"]:
@@ -91,7 +120,7 @@ class SECEDGARClient(APIClient):
                 logger.warning(f"Invalid priordate_str format: {priordate_str}. Should be YYYY-MM-DD. Ignoring.")
 
         for i, form_val in enumerate(forms):
-            if form_val.upper() == form_type.upper():
+            if form_val.upper() in form_priority:
                 try:
                     current_filing_date = datetime.strptime(filing_dates[i], '%Y-%m-%d').date()
                 except ValueError:
@@ -112,9 +141,12 @@ class SECEDGARClient(APIClient):
                 target_filings_info.append({"url": doc_url, "date": current_filing_date, "form": form_val})
 
         if not target_filings_info:
-            logger.info(f"No '{form_type}' filings found for CIK {cik} matching criteria.")
+            logger.info(f"No '{form_label}' filings found for CIK {cik} matching criteria.")
             return None if count == 1 else []
 
+        if len(form_priority) > 1:
+            best_form = min((f_info["form"].upper() for f_info in target_filings_info), key=form_priority.index)
+            target_filings_info = [f_info for f_info in target_filings_info if f_info["form"].upper() == best_form]
         target_filings_info.sort(key=lambda x: x["date"], reverse=True)
 
         if count == 1:
@@ -128,7 +160,8 @@ class SECEDGARClient(APIClient):
         try:
             text_content = self.request("GET", filing_url, use_cache=True,
                                         api_source_name="edgar_filing_text_content",
-                                        is_json_response=False)
+                                        is_json_response=False,
+                                        cache_expiry_seconds=SEC_FILING_TEXT_CACHE_EXPIRY_SECONDS)
             if text_content:
                 if isinstance(text_content, bytes):
                     try:
@@ -139,4 +172,38 @@ class SECEDGARClient(APIClient):
             return text_content
         except requests.exceptions.RequestException as e:
             logger.error(f"Error fetching SEC filing text from {filing_url}: {e}")
-            return None
\ No newline at end of file
+            return None
+
+    def get_filing_sections(self, filing_text, sections_map, max_section_chars=None, source_url=None):
+        """
+        extract_S1_text_sections with the result persisted in the API cache.
+        Keyed by a hash of the filing text, the sections map and the section cap, so a re-analysis of an
+        unchanged filing skips the multi-megabyte parse. Recent results are also memoized in process.
+        Documents under the EDGAR Archives are immutable, so when source_url points there it replaces the
+        text in the key and the filing text isn't hashed at all.
+        """
+        if not filing_text: return {}
+        sections_map_key = json.dumps(sections_map, sort_keys=True)
+        if source_url and source_url.startswith(self._archives_base):
+            url_hash = hashlib.sha1(f"{sections_map_key}\0{max_section_chars}\0{source_url}".encode("utf-8")).hexdigest()
+            cache_key_str = f"FILING_SECTIONS_URL:{url_hash}"
+        else:
+            text_hash = hashlib.sha1(f"{sections_map_key}\0{max_section_chars}\0{filing_text}".encode("utf-8", errors="replace")).hexdigest()
+            cache_key_str = f"FILING_SECTIONS:{text_hash}"
+
+        with self._sections_memo_lock:
+            memo_sections = self._sections_memo.get(cache_key_str)
+            if memo_sections is not None:
+                self._sections_memo.move_to_end(cache_key_str)
+                return memo_sections
+
+        sections = self._get_cached_response(cache_key_str)
+        if sections is None:
+            sections = extract_S1_text_sections(filing_text, sections_map, max_section_chars=max_section_chars)
+            self._cache_response(cache_key_str, sections, "edgar_filing_sections", SEC_FILING_TEXT_CACHE_EXPIRY_SECONDS)
+
+        with self._sections_memo_lock:
+            self._sections_memo[cache_key_str] = sections
+            if len(self._sections_memo) > _SECTIONS_MEMO_MAX_ENTRIES:
+                self._sections_memo.popitem(last=False)
+        return sections
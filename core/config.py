@@ -37,6 +37,12 @@ API_REQUEST_TIMEOUT = 45  # seconds
 API_RETRY_ATTEMPTS = 3
 API_RETRY_DELAY = 10  # seconds
 
+# Shared per-service request budgets (token buckets in api_clients/rate_limiter.py)
+SEC_EDGAR_MAX_REQUESTS_PER_SECOND = 10  # SEC fair-access limit
+FINNHUB_MAX_REQUESTS_PER_MINUTE = 60  # Finnhub free tier
+GEMINI_MAX_REQUESTS_PER_MINUTE = 10
+GEMINI_MAX_CONCURRENT_REQUESTS = 4  # In-flight generateContent calls across all threads
+
 # Gemini API Configuration
 GEMINI_PROMPT_MAX_CHARS_HARD_TRUNCATE = 400000 # Max input characters
 GEMINI_MAX_OUTPUT_TOKENS = 8192 # Max output tokens
@@ -55,6 +61,10 @@ IPO_ANALYSIS_REANALYZE_DAYS = 7
 
 # Cache Settings
 CACHE_EXPIRY_SECONDS = 3600 * 6
+SEC_FILING_TEXT_CACHE_EXPIRY_SECONDS = 3600 * 24 * 30  # Filing documents under an accession number never change
+SEC_CIK_MAP_CACHE_EXPIRY_SECONDS = 3600 * 24 * 7  # Ticker->CIK map changes rarely
+GEMINI_RESPONSE_CACHE_EXPIRY_SECONDS = 3600 * 24  # Same prompt within a day (re-runs/retries) reuses the answer
+FINNHUB_IPO_CALENDAR_CACHE_EXPIRY_SECONDS = 3600 * 24  # Calendar window is keyed by date, so a day is its useful lifetime
 
 # DCF Analysis Defaults
 DEFAULT_DISCOUNT_RATE = 0.09
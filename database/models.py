@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Float, DateTime, Text, JSON, ForeignKey, Boolean, Date, UniqueConstraint
+from sqlalchemy import Column, Integer, String, Float, DateTime, Text, JSON, ForeignKey, Boolean, Date, UniqueConstraint, Index
 from sqlalchemy.orm import relationship
 from datetime import datetime, timezone
 from .connection import Base  # Import Base from connection.py
@@ -127,6 +127,10 @@ class IPOAnalysis(Base):
     s1_sections_used = Column(JSON, nullable=True)
 
     ipo = relationship("IPO", back_populates="analyses")
+    # Serves "latest analysis for this IPO" (WHERE ipo_id = ? ORDER BY analysis_date DESC LIMIT 1) with one index seek.
+    # create_all() does not add indexes to existing tables; on an existing DB run:
+    # CREATE INDEX ix_ipo_analyses_ipo_id_date ON ipo_analyses (ipo_id, analysis_date DESC);
+    __table_args__ = (Index('ix_ipo_analyses_ipo_id_date', 'ipo_id', analysis_date.desc()),)
 
 
 class NewsEvent(Base):
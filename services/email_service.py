@@ -1,10 +1,11 @@
-import smtplib
-from email.mime.text import MIMEText
-from email.mime.multipart import MIMEMultipart
+import contextlib
+from typing import TYPE_CHECKING
 from datetime import datetime, timezone
 import json
 import math
-from markdown2 import Markdown
+import re
+from html import escape
+import functools
 
 from core.config import (
     EMAIL_HOST, EMAIL_PORT, EMAIL_USE_TLS, EMAIL_HOST_USER,
@@ -13,82 +14,232 @@ from core.config import (
 from core.logging_setup import logger
 from database.models import StockAnalysis, IPOAnalysis, NewsEventAnalysis
 
+if TYPE_CHECKING: # Imported lazily at runtime; the services package imports this module eagerly.
+    from email.message import EmailMessage
+
+# One shared converter for the process; markdown2 keeps no state between convert() calls that we rely on.
+# Built on first use so importing the services package doesn't pay for markdown2's setup.
+_shared_markdowner = None
+
+
+def _get_markdowner():
+    global _shared_markdowner
+    if _shared_markdowner is None:
+        from markdown2 import Markdown
+        # safe_mode="escape": raw HTML in model output is shown as text rather than injected into the email.
+        _shared_markdowner = Markdown(extras=["tables", "fenced-code-blocks", "break-on-newline", "smarty-pants"],
+                                      safe_mode="escape")
+    return _shared_markdowner
+
+
+@functools.lru_cache(maxsize=4096)
+def _md_cached(text: str) -> str:
+    # Many fields repeat across analyses (boilerplate summaries, "N/A" strings), so memoize the render.
+    return _get_markdowner().convert(text)
+
+
+_NA_HTML = "<p>N/A</p>"
+_MD_MAX_CHARS = 200_000 # Fields longer than this skip markdown rendering entirely
+
+# Anything markdown2 (incl. the smarty-pants/break-on-newline extras) would transform differently from plain
+# escaping: inline syntax chars, entities, smart-punctuation sequences, paragraph breaks, block-level line starts, autolinks.
+_MD_SYNTAX_RE = re.compile(
+    r"[*_#`\[\]|<>~\\\"'\t\r]|&#?\w+;|--|\.\.\.|\n\s*\n|^\s*(?:[-+]|\d+[.)])\s|^ {4}|^\s*[=-]+\s*$|https?://|www\.|@",
+    re.MULTILINE)
+
+
+def _h(val, na_val="N/A"):
+    # Plain DB/API values (names, titles, URLs) dropped into the HTML; escape so '&', '<', quotes can't break markup.
+    if val is None or val == "": return na_val
+    return escape(str(val))
+
+
+@functools.lru_cache(maxsize=1024)
+def _fmt_dt(dt, fmt="%Y-%m-%d %H:%M %Z"):
+    # Analysis timestamps repeat across blocks and resends; format each distinct one once.
+    return dt.strftime(fmt) if dt else "N/A"
+
+
+def _fmt_num(val, fmt_type="decimal", na_val="N/A"):
+    # Module-level so it isn't re-created per analysis; called ~35 times per stock block.
+    if val is None or (isinstance(val, float) and not math.isfinite(val)): return na_val
+    if fmt_type == "percent": return f"{val * 100:.2f}%"
+    if fmt_type == "decimal": return f"{val:.2f}"
+    if fmt_type == "currency": return f"${val:,.2f}" if isinstance(val, (int,float)) else str(val)
+    if fmt_type == "large_number": return f"{val:,.0f}" if isinstance(val, (int,float)) else str(val)
+    return str(val)
+
+
+# (label, attribute fallback chain) for the markdown sections of each block; the first truthy attribute wins.
+_STOCK_QUALITATIVE_SECTIONS = (
+    ("Business Summary", ("business_summary",)),
+    ("Economic Moat", ("economic_moat_summary",)),
+    ("Industry Trends & Position", ("industry_trends_summary",)),
+    ("Competitive Landscape", ("competitive_landscape_summary",)),
+    ("Management Discussion Highlights (MD&A/Assessment)", ("management_assessment_summary",)),
+    ("Key Risk Factors", ("risk_factors_summary",)),
+)
+_IPO_SUMMARY_SECTIONS = ( # Canonical fields first; the alias columns only hold data on rows from older runs
+    ("Business Summary (Inferred/AI Synthesized)", ("s1_business_summary", "business_model_summary")),
+    ("Competitive Landscape (Inferred/AI Synthesized)", ("competitive_landscape_summary",)),
+    ("Industry Outlook (Inferred/AI Synthesized)", ("industry_outlook_summary",)),
+    ("Risk Factors Summary (Inferred/AI Synthesized)", ("s1_risk_factors_summary", "risk_factors_summary")),
+    ("Use of Proceeds (Inferred/AI Synthesized)", ("use_of_proceeds_summary",)),
+    ("MD&A / Financial Health Summary (Inferred/AI Synthesized)", ("s1_financial_health_summary", "pre_ipo_financials_summary", "s1_mda_summary")),
+    ("Management Team Assessment (AI Synthesized)", ("management_team_assessment",)),
+    ("Underwriter Quality Assessment (AI Synthesized)", ("underwriter_quality_assessment",)),
+    ("Valuation Comparison Guidance (AI Synthesized)", ("valuation_comparison_summary",)),
+)
+_NEWS_IMPACT_DETAIL_SECTIONS = (
+    ("Mechanism of Impact", ("mechanism_of_impact",)),
+    ("Estimated Timing & Duration", ("estimated_timing_duration",)),
+    ("Estimated Magnitude & Direction", ("estimated_magnitude_direction",)),
+    ("Confidence of Assessment", ("confidence_of_assessment",)),
+)
+
+
+# Whitespace is only significant inside <pre> (JSON snapshots, fenced code); everything else can be collapsed.
+_PRE_BLOCK_SPLIT_RE = re.compile(r"(<pre\b.*?</pre>)", re.IGNORECASE | re.DOTALL)
+_WHITESPACE_RUN_RE = re.compile(r"\s+")
+
+
+def _minify_html(html_text: str) -> str:
+    segments = _PRE_BLOCK_SPLIT_RE.split(html_text)
+    # Odd indices are the captured <pre> blocks; leave those untouched.
+    return "".join(seg if i % 2 else _WHITESPACE_RUN_RE.sub(" ", seg) for i, seg in enumerate(segments)).strip()
+
+
+# Static stylesheet for the summary email; kept out of the f-string so it is built once at import.
+_EMAIL_CSS = """
+    body { font-family: -apple-system, BlinkMacSystemFont, "Segoe UI", Roboto, Helvetica, Arial, sans-serif, "Apple Color Emoji", "Segoe UI Emoji", "Segoe UI Symbol"; margin: 0; padding: 20px; background-color: #f0f2f5; line-height: 1.65; color: #333; }
+    .container { background-color: #ffffff; padding: 25px; border-radius: 10px; box-shadow: 0 4px 15px rgba(0,0,0,0.1); max-width: 950px; margin: 20px auto; }
+    .analysis-block { border: 1px solid #e0e0e0; padding: 20px; margin-bottom: 30px; border-radius: 8px; background-color: #fcfcfc; box-shadow: 0 2px 5px rgba(0,0,0,0.07);}
+    .stock-analysis { border-left: 6px solid #2ecc71; } /* Green */
+    .ipo-analysis { border-left: 6px solid #3498db; }   /* Blue */
+    .news-analysis { border-left: 6px solid #f39c12; } /* Orange */
+    h1 { color: #2c3e50; text-align: center; border-bottom: 3px solid #3498db; padding-bottom: 15px; margin-bottom:20px; font-size:2em; }
+    h2 { color: #2980b9; border-bottom: 2px solid #eaeff2; padding-bottom: 8px; margin-top: 10px; font-size:1.6em; }
+    h4 { color: #34495e; margin-top: 18px; margin-bottom: 8px; font-size:1.1em; }
+    details > summary { cursor: pointer; font-weight: bold; margin-bottom: 12px; color: #2c3e50; padding: 10px 15px; background-color: #eaf1f4; border-radius:5px; transition: background-color 0.2s ease; }
+    details > summary:hover { background-color: #dce7ec; }
+    details[open] > summary { background-color: #d1dde2; }
+    pre { background-color: #f5f7fa; padding: 12px; border-radius: 5px; font-family: "SFMono-Regular", Consolas, "Liberation Mono", Menlo, Courier, monospace; white-space: pre-wrap; word-wrap: break-word; font-size: 0.9em; border: 1px solid #d1d5da; overflow-x: auto; }
+    ul { list-style-type: disc; margin-left: 25px; padding-left: 5px; } li { margin-bottom: 10px; }
+    .markdown-content p { margin: 0.7em 0; } .markdown-content ul, .markdown-content ol { margin-left: 20px; }
+    .markdown-content table { border-collapse: collapse; width: 100%; margin-bottom: 1em; font-size:0.95em;}
+    .markdown-content th, .markdown-content td { border: 1px solid #d1d5da; padding: 10px; text-align: left; } .markdown-content th { background-color: #f1f5f8; font-weight:bold; }
+    .report-footer { text-align: center; font-size: 0.85em; color: #888; margin-top: 35px; padding-top:15px; border-top:1px solid #eee; }
+    a { color: #3498db; text-decoration:none; } a:hover { text-decoration:underline; }
+"""
+
+# Static document chrome around the per-analysis blocks; only the "Generated" timestamp is per-email.
+_EMAIL_HEAD_HTML = f"""
+        <html><head><style>
+{_EMAIL_CSS}        </style></head><body><div class="container">
+            <h1>Financial Analysis Report</h1>"""
+_EMAIL_DISCLAIMER_HTML = """
+            <p style="text-align:center; font-style:italic; color:#7f8c8d; margin-bottom:25px;"><em>This email contains automated analysis. Always do your own research before making investment decisions.</em></p>"""
+_EMAIL_FOOTER_HTML = """<div class="report-footer"><p>(c) Automated Financial Analysis System</p></div></div></body></html>"""
+
 
 class EmailService:
-    def __init__(self):
-        self.markdowner = Markdown(extras=["tables", "fenced-code-blocks", "break-on-newline", "smarty-pants"])
+    @property
+    def markdowner(self):
+        return _get_markdowner()
 
     def _md_to_html(self, md_text):
-        if md_text is None: return "<p>N/A</p>"
+        if md_text is None or md_text == "": return _NA_HTML
         if isinstance(md_text, (dict, list)):
             # Pretty print JSON, then wrap in pre for email
             try:
                 pretty_json = json.dumps(md_text, indent=2, ensure_ascii=False)
                 # Basic HTML escaping for JSON string to be safe inside <pre>
-                escaped_json = pretty_json.replace("&", "&").replace("<", "<").replace(">", ">")
-                return f"<pre>{escaped_json}</pre>"
+                return f"<pre>{escape(pretty_json, quote=False)}</pre>"
             except Exception:
-                return f"<pre>{str(md_text)}</pre>" # Fallback for non-serializable
+                return f"<pre>{escape(str(md_text), quote=False)}</pre>" # Fallback for non-serializable
         if not isinstance(md_text, str): md_text = str(md_text)
-        # Avoid re-processing if it looks like HTML already
-        if "<" in md_text and ">" in md_text and ("<p>" in md_text.lower() or "<div>" in md_text.lower() or "<ul>" in md_text.lower()):
-            return md_text
-        return self.markdowner.convert(md_text)
+        # Field text is untrusted model output: the size cap runs before anything else, and every path below
+        # escapes it (here, the plain-prose path, or markdown2's safe_mode="escape"); nothing is passed through raw.
+        # markdown2 is regex-driven and can degrade badly on huge or malformed input; show oversized fields verbatim.
+        if len(md_text) > _MD_MAX_CHARS:
+            return f"<pre>{escape(md_text[:_MD_MAX_CHARS], quote=False)}\n... [truncated]</pre>"
+        # Plain prose (the bulk of short fields) doesn't need the markdown pipeline at all.
+        if md_text.strip() and not _MD_SYNTAX_RE.search(md_text):
+            return "<p>" + escape(md_text.strip(), quote=False).replace("\n", "<br />\n") + "</p>\n"
+        return _md_cached(md_text)
+
+    def _render_md_sections(self, analysis, sections):
+        rendered = []
+        for label, attrs in sections:
+            value = None
+            for attr in attrs:
+                value = getattr(analysis, attr)
+                if value: break
+            value_html = _NA_HTML if value is None or value == "" else self._md_to_html(value)
+            rendered.append(f'<p><strong>{label}:</strong></p><div class="markdown-content">{value_html}</div>')
+        return "\n".join(rendered)
+
+    def _render_impact_table(self, json_str, columns):
+        # The news pipeline stores affected companies/sectors as JSON array strings; render them as a table
+        # directly instead of pushing the raw JSON through markdown.
+        try:
+            rows = json.loads(json_str) if isinstance(json_str, str) else json_str
+        except (ValueError, TypeError):
+            return self._md_to_html(json_str)
+        if not isinstance(rows, list) or not all(isinstance(row, dict) for row in rows):
+            return self._md_to_html(json_str)
+        if not rows: return "<p>None identified.</p>"
+        header_html = "".join(f"<th>{escape(label)}</th>" for _, label in columns)
+        body_html = "".join(
+            "<tr>" + "".join(f"<td>{escape(str(row.get(key) or 'N/A'))}</td>" for key, _ in columns) + "</tr>"
+            for row in rows
+        )
+        return f"<table><thead><tr>{header_html}</tr></thead><tbody>{body_html}</tbody></table>"
 
     def _format_stock_analysis_html(self, analysis: StockAnalysis):
         if not analysis: return ""
         stock = analysis.stock
 
-        def fmt_num(val, type="decimal", na_val="N/A"):
-            if val is None or (isinstance(val, float) and (math.isnan(val) or math.isinf(val))): return na_val
-            if type == "percent": return f"{val * 100:.2f}%"
-            if type == "decimal": return f"{val:.2f}"
-            if type == "currency": return f"${val:,.2f}" if isinstance(val, (int,float)) else str(val)
-            if type == "large_number": return f"{val:,.0f}" if isinstance(val, (int,float)) else str(val)
-            return str(val)
-
-        business_summary_html = self._md_to_html(analysis.business_summary)
-        economic_moat_html = self._md_to_html(analysis.economic_moat_summary)
-        industry_trends_html = self._md_to_html(analysis.industry_trends_summary)
-        competitive_landscape_html = self._md_to_html(analysis.competitive_landscape_summary)
-        management_assessment_html = self._md_to_html(analysis.management_assessment_summary)
-        risk_factors_html = self._md_to_html(analysis.risk_factors_summary)
+        qualitative_sections_html = self._render_md_sections(analysis, _STOCK_QUALITATIVE_SECTIONS)
         investment_thesis_html = self._md_to_html(analysis.investment_thesis_full)
         reasoning_points_html = self._md_to_html(analysis.reasoning)
 
-        dcf_assumptions_html = "<ul>"
+        # Assemble the assumption items as a list and join once instead of repeated string appends.
+        dcf_items = []
         if analysis.dcf_assumptions and isinstance(analysis.dcf_assumptions, dict):
             assumptions_data = analysis.dcf_assumptions
-            dcf_assumptions_html += f"<li>Discount Rate: {fmt_num(assumptions_data.get('discount_rate'), 'percent')}</li>"
-            dcf_assumptions_html += f"<li>Perpetual Growth Rate: {fmt_num(assumptions_data.get('perpetual_growth_rate'), 'percent')}</li>"
-            dcf_assumptions_html += f"<li>FCF Projection Years: {assumptions_data.get('projection_years', 'N/A')}</li>"
-            dcf_assumptions_html += f"<li>Starting FCF ({assumptions_data.get('start_fcf_basis','N/A')}): {fmt_num(assumptions_data.get('start_fcf'), 'large_number')}</li>"
-            dcf_assumptions_html += f"<li>Initial FCF Growth ({assumptions_data.get('initial_fcf_growth_rate_basis','N/A')}): {fmt_num(assumptions_data.get('initial_fcf_growth_rate_used'), 'percent')}</li>"
+            dcf_items.extend((
+                f"<li>Discount Rate: {_fmt_num(assumptions_data.get('discount_rate'), 'percent')}</li>",
+                f"<li>Perpetual Growth Rate: {_fmt_num(assumptions_data.get('perpetual_growth_rate'), 'percent')}</li>",
+                f"<li>FCF Projection Years: {assumptions_data.get('projection_years', 'N/A')}</li>",
+                f"<li>Starting FCF ({assumptions_data.get('start_fcf_basis','N/A')}): {_fmt_num(assumptions_data.get('start_fcf'), 'large_number')}</li>",
+                f"<li>Initial FCF Growth ({assumptions_data.get('initial_fcf_growth_rate_basis','N/A')}): {_fmt_num(assumptions_data.get('initial_fcf_growth_rate_used'), 'percent')}</li>",
+            ))
 
             fcf_growth_proj = assumptions_data.get('fcf_growth_rates_projection')
             if fcf_growth_proj and isinstance(fcf_growth_proj, list):
-                 dcf_assumptions_html += f"<li>Projected FCF Growth Rates (annual): {', '.join([fmt_num(r, 'percent') for r in fcf_growth_proj])}</li>"
+                dcf_items.append(f"<li>Projected FCF Growth Rates (annual): {', '.join([_fmt_num(r, 'percent') for r in fcf_growth_proj])}</li>")
 
             sensitivity_analysis = assumptions_data.get("sensitivity_analysis")
             if sensitivity_analysis and isinstance(sensitivity_analysis, list):
-                dcf_assumptions_html += "<li>Sensitivity Analysis Highlights:<ul>"
-                for sens_item in sensitivity_analysis[:3]: # Show a few
-                    dcf_assumptions_html += f"<li>{sens_item.get('scenario', 'N/A')}: IV {fmt_num(sens_item.get('intrinsic_value'), 'currency')} (Upside: {fmt_num(sens_item.get('upside'), 'percent')})</li>"
-                if len(sensitivity_analysis) > 3:
-                    dcf_assumptions_html += "<li>... more available in full data.</li>"
-                dcf_assumptions_html += "</ul></li>"
+                sens_items = "".join(
+                    f"<li>{sens_item.get('scenario', 'N/A')}: IV {_fmt_num(sens_item.get('intrinsic_value'), 'currency')} (Upside: {_fmt_num(sens_item.get('upside'), 'percent')})</li>"
+                    for sens_item in sensitivity_analysis[:3] # Show a few
+                )
+                more_item = "<li>... more available in full data.</li>" if len(sensitivity_analysis) > 3 else ""
+                dcf_items.append(f"<li>Sensitivity Analysis Highlights:<ul>{sens_items}{more_item}</ul></li>")
         else:
-            dcf_assumptions_html += "<li>N/A</li>"
-        dcf_assumptions_html += "</ul>"
+            dcf_items.append("<li>N/A</li>")
+        dcf_assumptions_html = f"<ul>{''.join(dcf_items)}</ul>"
 
         html = f"""
         <div class="analysis-block stock-analysis">
-            <h2>Stock Analysis: {stock.company_name} ({stock.ticker})</h2>
-            <p><strong>Analysis Date:</strong> {analysis.analysis_date.strftime('%Y-%m-%d %H:%M %Z')}</p>
-            <p><strong>Industry:</strong> {stock.industry or 'N/A'}, <strong>Sector:</strong> {stock.sector or 'N/A'}</p>
-            <p><strong>Investment Decision:</strong> {analysis.investment_decision or 'N/A'}</p>
-            <p><strong>Strategy Type:</strong> {analysis.strategy_type or 'N/A'}</p>
-            <p><strong>Confidence Level:</strong> {analysis.confidence_level or 'N/A'}</p>
+            <h2>Stock Analysis: {_h(stock.company_name)} ({_h(stock.ticker)})</h2>
+            <p><strong>Analysis Date:</strong> {_fmt_dt(analysis.analysis_date)}</p>
+            <p><strong>Industry:</strong> {_h(stock.industry)}, <strong>Sector:</strong> {_h(stock.sector)}</p>
+            <p><strong>Investment Decision:</strong> {_h(analysis.investment_decision)}</p>
+            <p><strong>Strategy Type:</strong> {_h(analysis.strategy_type)}</p>
+            <p><strong>Confidence Level:</strong> {_h(analysis.confidence_level)}</p>
             <details>
                 <summary><strong>Investment Thesis & Reasoning (Click to expand)</strong></summary>
                 <h4>Full Thesis:</h4><div class="markdown-content">{investment_thesis_html}</div>
@@ -97,42 +248,37 @@ class EmailService:
             <details>
                 <summary><strong>Key Financial Metrics (Click to expand)</strong></summary>
                 <ul>
-                    <li>P/E Ratio: {fmt_num(analysis.pe_ratio)}</li><li>P/B Ratio: {fmt_num(analysis.pb_ratio)}</li>
-                    <li>P/S Ratio: {fmt_num(analysis.ps_ratio)}</li><li>EV/Sales: {fmt_num(analysis.ev_to_sales)}</li>
-                    <li>EV/EBITDA: {fmt_num(analysis.ev_to_ebitda)}</li><li>EPS: {fmt_num(analysis.eps, 'currency')}</li>
-                    <li>ROE: {fmt_num(analysis.roe, 'percent')}</li><li>ROA: {fmt_num(analysis.roa, 'percent')}</li>
-                    <li>ROIC: {fmt_num(analysis.roic, 'percent')}</li><li>Dividend Yield: {fmt_num(analysis.dividend_yield, 'percent')}</li>
-                    <li>Debt-to-Equity: {fmt_num(analysis.debt_to_equity)}</li><li>Debt-to-EBITDA: {fmt_num(analysis.debt_to_ebitda)}</li>
-                    <li>Interest Coverage: {fmt_num(analysis.interest_coverage_ratio)}x</li><li>Current Ratio: {fmt_num(analysis.current_ratio)}</li>
-                    <li>Quick Ratio: {fmt_num(analysis.quick_ratio)}</li>
-                    <li>Gross Profit Margin: {fmt_num(analysis.gross_profit_margin, 'percent')}</li>
-                    <li>Operating Profit Margin: {fmt_num(analysis.operating_profit_margin, 'percent')}</li>
-                    <li>Net Profit Margin: {fmt_num(analysis.net_profit_margin, 'percent')}</li>
-                    <li>Revenue Growth YoY: {fmt_num(analysis.revenue_growth_yoy, 'percent')} (QoQ: {fmt_num(analysis.revenue_growth_qoq, 'percent')})</li>
-                    <li>Revenue Growth CAGR (3yr/5yr): {fmt_num(analysis.revenue_growth_cagr_3yr, 'percent')} / {fmt_num(analysis.revenue_growth_cagr_5yr, 'percent')}</li>
-                    <li>EPS Growth YoY: {fmt_num(analysis.eps_growth_yoy, 'percent')}</li>
-                    <li>EPS Growth CAGR (3yr/5yr): {fmt_num(analysis.eps_growth_cagr_3yr, 'percent')} / {fmt_num(analysis.eps_growth_cagr_5yr, 'percent')}</li>
-                    <li>FCF per Share: {fmt_num(analysis.free_cash_flow_per_share, 'currency')}</li><li>FCF Yield: {fmt_num(analysis.free_cash_flow_yield, 'percent')}</li>
-                    <li>FCF Trend: {analysis.free_cash_flow_trend or 'N/A'}</li><li>Retained Earnings Trend: {analysis.retained_earnings_trend or 'N/A'}</li>
+                    <li>P/E Ratio: {_fmt_num(analysis.pe_ratio)}</li><li>P/B Ratio: {_fmt_num(analysis.pb_ratio)}</li>
+                    <li>P/S Ratio: {_fmt_num(analysis.ps_ratio)}</li><li>EV/Sales: {_fmt_num(analysis.ev_to_sales)}</li>
+                    <li>EV/EBITDA: {_fmt_num(analysis.ev_to_ebitda)}</li><li>EPS: {_fmt_num(analysis.eps, 'currency')}</li>
+                    <li>ROE: {_fmt_num(analysis.roe, 'percent')}</li><li>ROA: {_fmt_num(analysis.roa, 'percent')}</li>
+                    <li>ROIC: {_fmt_num(analysis.roic, 'percent')}</li><li>Dividend Yield: {_fmt_num(analysis.dividend_yield, 'percent')}</li>
+                    <li>Debt-to-Equity: {_fmt_num(analysis.debt_to_equity)}</li><li>Debt-to-EBITDA: {_fmt_num(analysis.debt_to_ebitda)}</li>
+                    <li>Interest Coverage: {_fmt_num(analysis.interest_coverage_ratio)}x</li><li>Current Ratio: {_fmt_num(analysis.current_ratio)}</li>
+                    <li>Quick Ratio: {_fmt_num(analysis.quick_ratio)}</li>
+                    <li>Gross Profit Margin: {_fmt_num(analysis.gross_profit_margin, 'percent')}</li>
+                    <li>Operating Profit Margin: {_fmt_num(analysis.operating_profit_margin, 'percent')}</li>
+                    <li>Net Profit Margin: {_fmt_num(analysis.net_profit_margin, 'percent')}</li>
+                    <li>Revenue Growth YoY: {_fmt_num(analysis.revenue_growth_yoy, 'percent')} (QoQ: {_fmt_num(analysis.revenue_growth_qoq, 'percent')})</li>
+                    <li>Revenue Growth CAGR (3yr/5yr): {_fmt_num(analysis.revenue_growth_cagr_3yr, 'percent')} / {_fmt_num(analysis.revenue_growth_cagr_5yr, 'percent')}</li>
+                    <li>EPS Growth YoY: {_fmt_num(analysis.eps_growth_yoy, 'percent')}</li>
+                    <li>EPS Growth CAGR (3yr/5yr): {_fmt_num(analysis.eps_growth_cagr_3yr, 'percent')} / {_fmt_num(analysis.eps_growth_cagr_5yr, 'percent')}</li>
+                    <li>FCF per Share: {_fmt_num(analysis.free_cash_flow_per_share, 'currency')}</li><li>FCF Yield: {_fmt_num(analysis.free_cash_flow_yield, 'percent')}</li>
+                    <li>FCF Trend: {_h(analysis.free_cash_flow_trend)}</li><li>Retained Earnings Trend: {_h(analysis.retained_earnings_trend)}</li>
                 </ul>
             </details>
             <details>
                 <summary><strong>DCF Analysis (Simplified) (Click to expand)</strong></summary>
                 <ul>
-                    <li>Intrinsic Value per Share: {fmt_num(analysis.dcf_intrinsic_value, 'currency')}</li>
-                    <li>Upside/Downside: {fmt_num(analysis.dcf_upside_percentage, 'percent')}</li>
+                    <li>Intrinsic Value per Share: {_fmt_num(analysis.dcf_intrinsic_value, 'currency')}</li>
+                    <li>Upside/Downside: {_fmt_num(analysis.dcf_upside_percentage, 'percent')}</li>
                 </ul>
                 <p><em>Key Assumptions Used:</em></p>
                 {dcf_assumptions_html}
             </details>
             <details>
                 <summary><strong>Qualitative Analysis (from 10-K/Profile & AI) (Click to expand)</strong></summary>
-                <p><strong>Business Summary:</strong></p><div class="markdown-content">{business_summary_html}</div>
-                <p><strong>Economic Moat:</strong></p><div class="markdown-content">{economic_moat_html}</div>
-                <p><strong>Industry Trends & Position:</strong></p><div class="markdown-content">{industry_trends_html}</div>
-                <p><strong>Competitive Landscape:</strong></p><div class="markdown-content">{competitive_landscape_html}</div>
-                <p><strong>Management Discussion Highlights (MD&A/Assessment):</strong></p><div class="markdown-content">{management_assessment_html}</div>
-                <p><strong>Key Risk Factors:</strong></p><div class="markdown-content">{risk_factors_html}</div>
+                {qualitative_sections_html}
             </details>
             <details>
                 <summary><strong>Supporting Data Snapshots (Click to expand)</strong></summary>
@@ -159,17 +305,7 @@ class EmailService:
             return "N/A"
 
         reasoning_html = self._md_to_html(analysis.reasoning)
-        # Prefer more specific summaries if available
-        business_summary_html = self._md_to_html(analysis.business_model_summary or analysis.s1_business_summary)
-        risk_factors_summary_html = self._md_to_html(analysis.risk_factors_summary or analysis.s1_risk_factors_summary)
-        financial_health_summary_html = self._md_to_html(analysis.pre_ipo_financials_summary or analysis.s1_financial_health_summary or analysis.s1_mda_summary)
-
-        competitive_landscape_html = self._md_to_html(analysis.competitive_landscape_summary)
-        industry_outlook_html = self._md_to_html(analysis.industry_outlook_summary)
-        use_of_proceeds_html = self._md_to_html(analysis.use_of_proceeds_summary)
-        management_team_html = self._md_to_html(analysis.management_team_assessment)
-        underwriter_html = self._md_to_html(analysis.underwriter_quality_assessment)
-        valuation_html = self._md_to_html(analysis.valuation_comparison_summary)
+        summary_sections_html = self._render_md_sections(analysis, _IPO_SUMMARY_SECTIONS)
 
         s1_disclaimer = ""
         if analysis.s1_sections_used and isinstance(analysis.s1_sections_used, dict):
@@ -184,26 +320,18 @@ class EmailService:
                 """
         html = f"""
         <div class="analysis-block ipo-analysis">
-            <h2>IPO Analysis: {ipo.company_name} ({ipo.symbol or 'N/A'})</h2>
-            <p><strong>Expected IPO Date:</strong> {ipo.ipo_date.strftime('%Y-%m-%d') if ipo.ipo_date else ipo.ipo_date_str or 'N/A'}</p>
+            <h2>IPO Analysis: {_h(ipo.company_name)} ({_h(ipo.symbol)})</h2>
+            <p><strong>Expected IPO Date:</strong> {ipo.ipo_date.strftime('%Y-%m-%d') if ipo.ipo_date else _h(ipo.ipo_date_str)}</p>
             <p><strong>Expected Price Range:</strong> {fmt_price(ipo.expected_price_range_low, ipo.expected_price_range_high, ipo.expected_price_currency)}</p>
-            <p><strong>Exchange:</strong> {ipo.exchange or 'N/A'}, <strong>Status:</strong> {ipo.status or 'N/A'}</p>
-            <p><strong>S-1 Filing URL:</strong> {f'<a href="{ipo.s1_filing_url}">{ipo.s1_filing_url}</a>' if ipo.s1_filing_url else 'Not Found'}</p>
-            <p><strong>Analysis Date:</strong> {analysis.analysis_date.strftime('%Y-%m-%d %H:%M %Z')}</p>
-            <p><strong>Preliminary Stance:</strong> {analysis.investment_decision or 'N/A'}</p>
+            <p><strong>Exchange:</strong> {_h(ipo.exchange)}, <strong>Status:</strong> {_h(ipo.status)}</p>
+            <p><strong>S-1 Filing URL:</strong> {f'<a href="{_h(ipo.s1_filing_url)}">{_h(ipo.s1_filing_url)}</a>' if ipo.s1_filing_url else 'Not Found'}</p>
+            <p><strong>Analysis Date:</strong> {_fmt_dt(analysis.analysis_date)}</p>
+            <p><strong>Preliminary Stance:</strong> {_h(analysis.investment_decision)}</p>
             <details><summary><strong>AI Synthesized Reasoning & Critical Verification Points (Click to expand)</strong></summary><div class="markdown-content">{reasoning_html}</div></details>
             {s1_disclaimer}
             <details>
                 <summary><strong>Summaries (S-1 Inferred/AI Synthesized) & AI Analysis (Click to expand)</strong></summary>
-                <p><strong>Business Summary (Inferred/AI Synthesized):</strong></p><div class="markdown-content">{business_summary_html}</div>
-                <p><strong>Competitive Landscape (Inferred/AI Synthesized):</strong></p><div class="markdown-content">{competitive_landscape_html}</div>
-                <p><strong>Industry Outlook (Inferred/AI Synthesized):</strong></p><div class="markdown-content">{industry_outlook_html}</div>
-                <p><strong>Risk Factors Summary (Inferred/AI Synthesized):</strong></p><div class="markdown-content">{risk_factors_summary_html}</div>
-                <p><strong>Use of Proceeds (Inferred/AI Synthesized):</strong></p><div class="markdown-content">{use_of_proceeds_html}</div>
-                <p><strong>MD&A / Financial Health Summary (Inferred/AI Synthesized):</strong></p><div class="markdown-content">{financial_health_summary_html}</div>
-                <p><strong>Management Team Assessment (AI Synthesized):</strong></p><div class="markdown-content">{management_team_html}</div>
-                <p><strong>Underwriter Quality Assessment (AI Synthesized):</strong></p><div class="markdown-content">{underwriter_html}</div>
-                <p><strong>Valuation Comparison Guidance (AI Synthesized):</strong></p><div class="markdown-content">{valuation_html}</div>
+                {summary_sections_html}
             </details>
             <details><summary><strong>Supporting Data (Click to expand)</strong></summary>
                 <p><em>Raw IPO calendar API data:</em></p><div class="markdown-content">{self._md_to_html(analysis.key_data_snapshot)}</div>
@@ -217,30 +345,26 @@ class EmailService:
         news_event = analysis.news_event
         sentiment_html = self._md_to_html(f"**Sentiment:** {analysis.sentiment or 'N/A'}\n**Reasoning:** {analysis.sentiment_reasoning or 'N/A'}")
         news_summary_detailed_html = self._md_to_html(analysis.news_summary_detailed)
-        impact_companies_html = self._md_to_html(analysis.potential_impact_on_companies) # Assumed to be JSON string, will be pre-formatted
-        impact_sectors_html = self._md_to_html(analysis.potential_impact_on_sectors) # Assumed to be JSON string
-        mechanism_html = self._md_to_html(analysis.mechanism_of_impact)
-        timing_duration_html = self._md_to_html(analysis.estimated_timing_duration)
-        magnitude_direction_html = self._md_to_html(analysis.estimated_magnitude_direction)
-        confidence_html = self._md_to_html(analysis.confidence_of_assessment)
+        impact_companies_html = self._render_impact_table(analysis.potential_impact_on_companies,
+                                                          [("entityName", "Company"), ("tickerSymbol", "Ticker"), ("explanation", "Explanation")])
+        impact_sectors_html = self._render_impact_table(analysis.potential_impact_on_sectors,
+                                                        [("sectorName", "Sector"), ("explanation", "Explanation")])
+        impact_detail_sections_html = self._render_md_sections(analysis, _NEWS_IMPACT_DETAIL_SECTIONS)
         investor_summary_html = self._md_to_html(analysis.summary_for_email)
         html = f"""
         <div class="analysis-block news-analysis">
-            <h2>News/Event Analysis: {news_event.event_title}</h2>
-            <p><strong>Event Date:</strong> {news_event.event_date.strftime('%Y-%m-%d %H:%M %Z') if news_event.event_date else 'N/A'}</p>
-            <p><strong>Source:</strong> <a href="{news_event.source_url}">{news_event.source_name or news_event.source_url}</a></p>
+            <h2>News/Event Analysis: {_h(news_event.event_title)}</h2>
+            <p><strong>Event Date:</strong> {_fmt_dt(news_event.event_date)}</p>
+            <p><strong>Source:</strong> <a href="{_h(news_event.source_url)}">{_h(news_event.source_name or news_event.source_url)}</a></p>
             <p><strong>Full Article Scraped:</strong> {'Yes' if news_event.full_article_text else 'No (Analysis based on headline/summary if available)'}</p>
-            <p><strong>Analysis Date:</strong> {analysis.analysis_date.strftime('%Y-%m-%d %H:%M %Z')}</p>
+            <p><strong>Analysis Date:</strong> {_fmt_dt(analysis.analysis_date)}</p>
             <p><strong>Investor Summary:</strong></p><div class="markdown-content">{investor_summary_html}</div>
             <details><summary><strong>Detailed AI Analysis (Click to expand)</strong></summary>
                 <p><strong>Sentiment Analysis:</strong></p><div class="markdown-content">{sentiment_html}</div>
                 <p><strong>Detailed News Summary:</strong></p><div class="markdown-content">{news_summary_detailed_html}</div>
                 <p><strong>Potentially Affected Companies/Stocks:</strong></p><div class="markdown-content">{impact_companies_html}</div>
                 <p><strong>Potentially Affected Sectors:</strong></p><div class="markdown-content">{impact_sectors_html}</div>
-                <p><strong>Mechanism of Impact:</strong></p><div class="markdown-content">{mechanism_html}</div>
-                <p><strong>Estimated Timing & Duration:</strong></p><div class="markdown-content">{timing_duration_html}</div>
-                <p><strong>Estimated Magnitude & Direction:</strong></p><div class="markdown-content">{magnitude_direction_html}</div>
-                <p><strong>Confidence of Assessment:</strong></p><div class="markdown-content">{confidence_html}</div>
+                {impact_detail_sections_html}
             </details>
             <details><summary><strong>Key Snippets Used for Analysis (Click to expand)</strong></summary><div class="markdown-content">{self._md_to_html(analysis.key_news_snippets)}</div></details>
         </div>"""
@@ -249,52 +373,90 @@ class EmailService:
     def create_summary_email(self, stock_analyses=None, ipo_analyses=None, news_analyses=None):
         if not any([stock_analyses, ipo_analyses, news_analyses]):
             logger.info("No analyses provided to create an email."); return None
-        subject_date = datetime.now(timezone.utc).strftime("%Y-%m-%d")
-        subject = f"Financial Analysis Summary - {subject_date}"
-        # Enhanced CSS for better readability
-        html_body = f"""
-        <html><head><style>
-            body {{ font-family: -apple-system, BlinkMacSystemFont, "Segoe UI", Roboto, Helvetica, Arial, sans-serif, "Apple Color Emoji", "Segoe UI Emoji", "Segoe UI Symbol"; margin: 0; padding: 20px; background-color: #f0f2f5; line-height: 1.65; color: #333; }}
-            .container {{ background-color: #ffffff; padding: 25px; border-radius: 10px; box-shadow: 0 4px 15px rgba(0,0,0,0.1); max-width: 950px; margin: 20px auto; }}
-            .analysis-block {{ border: 1px solid #e0e0e0; padding: 20px; margin-bottom: 30px; border-radius: 8px; background-color: #fcfcfc; box-shadow: 0 2px 5px rgba(0,0,0,0.07);}}
-            .stock-analysis {{ border-left: 6px solid #2ecc71; }} /* Green */
-            .ipo-analysis {{ border-left: 6px solid #3498db; }}   /* Blue */
-            .news-analysis {{ border-left: 6px solid #f39c12; }} /* Orange */
-            h1 {{ color: #2c3e50; text-align: center; border-bottom: 3px solid #3498db; padding-bottom: 15px; margin-bottom:20px; font-size:2em; }}
-            h2 {{ color: #2980b9; border-bottom: 2px solid #eaeff2; padding-bottom: 8px; margin-top: 10px; font-size:1.6em; }}
-            h4 {{ color: #34495e; margin-top: 18px; margin-bottom: 8px; font-size:1.1em; }}
-            details > summary {{ cursor: pointer; font-weight: bold; margin-bottom: 12px; color: #2c3e50; padding: 10px 15px; background-color: #eaf1f4; border-radius:5px; transition: background-color 0.2s ease; }}
-            details > summary:hover {{ background-color: #dce7ec; }}
-            details[open] > summary {{ background-color: #d1dde2; }}
-            pre {{ background-color: #f5f7fa; padding: 12px; border-radius: 5px; font-family: "SFMono-Regular", Consolas, "Liberation Mono", Menlo, Courier, monospace; white-space: pre-wrap; word-wrap: break-word; font-size: 0.9em; border: 1px solid #d1d5da; overflow-x: auto; }}
-            ul {{ list-style-type: disc; margin-left: 25px; padding-left: 5px; }} li {{ margin-bottom: 10px; }}
-            .markdown-content p {{ margin: 0.7em 0; }} .markdown-content ul, .markdown-content ol {{ margin-left: 20px; }}
-            .markdown-content table {{ border-collapse: collapse; width: 100%; margin-bottom: 1em; font-size:0.95em;}}
-            .markdown-content th, .markdown-content td {{ border: 1px solid #d1d5da; padding: 10px; text-align: left; }} .markdown-content th {{ background-color: #f1f5f8; font-weight:bold; }}
-            .report-footer {{ text-align: center; font-size: 0.85em; color: #888; margin-top: 35px; padding-top:15px; border-top:1px solid #eee; }}
-            a {{ color: #3498db; text-decoration:none; }} a:hover {{ text-decoration:underline; }}
-        </style></head><body><div class="container">
-            <h1>Financial Analysis Report</h1>
-            <p style="text-align:center; font-style:italic; color:#555;">Generated: {datetime.now(timezone.utc).strftime('%Y-%m-%d %H:%M:%S %Z')}</p>
-            <p style="text-align:center; font-style:italic; color:#7f8c8d; margin-bottom:25px;"><em>This email contains automated analysis. Always do your own research before making investment decisions.</em></p>"""
-        if stock_analyses: html_body += "<h2>Individual Stock Analyses</h2>"; [html_body := html_body + self._format_stock_analysis_html(sa) for sa in stock_analyses]
-        if ipo_analyses: html_body += "<h2>Upcoming IPO Analyses</h2>"; [html_body := html_body + self._format_ipo_analysis_html(ia) for ia in ipo_analyses]
-        if news_analyses: html_body += "<h2>Recent News & Event Analyses</h2>"; [html_body := html_body + self._format_news_event_analysis_html(na) for na in news_analyses]
-        html_body += """<div class="report-footer"><p>(c) Automated Financial Analysis System</p></div></div></body></html>""" # Corrected typo in (c)
-        msg = MIMEMultipart('alternative'); msg['Subject'], msg['From'], msg['To'] = subject, EMAIL_SENDER, EMAIL_RECIPIENT
-        msg.attach(MIMEText(html_body, 'html', 'utf-8')); return msg
-
-    def send_email(self, message: MIMEMultipart):
-        if not message: logger.error("No message object provided to send_email."); return False
-        try:
+        now = datetime.now(timezone.utc) # One timestamp so subject and header can't straddle midnight
+        subject = f"Financial Analysis Summary - {now.strftime('%Y-%m-%d')}"
+        generated_html = f"""
+            <p style="text-align:center; font-style:italic; color:#555;">Generated: {now.strftime('%Y-%m-%d %H:%M:%S %Z')}</p>"""
+        # Collect blocks and join once; repeated += on the growing body is quadratic for large reports.
+        parts = [_EMAIL_HEAD_HTML, generated_html, _EMAIL_DISCLAIMER_HTML]
+        for heading, analyses, formatter in (
+            ("Individual Stock Analyses", stock_analyses, self._format_stock_analysis_html),
+            ("Upcoming IPO Analyses", ipo_analyses, self._format_ipo_analysis_html),
+            ("Recent News & Event Analyses", news_analyses, self._format_news_event_analysis_html),
+        ):
+            if analyses:
+                parts.append(f"<h2>{heading}</h2>")
+                parts.extend(map(formatter, analyses))
+        parts.append(_EMAIL_FOOTER_HTML)
+        html_body = _minify_html("".join(parts))
+        from email.message import EmailMessage
+        msg = EmailMessage(); msg['Subject'], msg['From'], msg['To'] = subject, EMAIL_SENDER, EMAIL_RECIPIENT
+        # Encode the body once and hand the bytes over as-is. base64 rather than 8bit: the minified body is a
+        # single line far beyond SMTP's 998-octet limit.
+        msg.set_content(html_body.encode('utf-8'), maintype='text', subtype='html', cte='base64', params={'charset': 'utf-8'})
+        return msg
+
+    @contextlib.contextmanager
+    def smtp_session(self):
+        # One connection (TLS handshake + AUTH) that can be reused for a batch of send_email calls.
+        import smtplib
+        if EMAIL_PORT == 465: # Implicit TLS; saves the STARTTLS round-trip
+            smtp_server = smtplib.SMTP_SSL(EMAIL_HOST, EMAIL_PORT, timeout=30)
+        else:
             smtp_server = smtplib.SMTP(EMAIL_HOST, EMAIL_PORT, timeout=30) # Increased timeout
-            if EMAIL_USE_TLS: smtp_server.starttls()
+        try: # Opened right after connecting so a failed STARTTLS/login still closes the socket
+            if EMAIL_USE_TLS and EMAIL_PORT != 465: smtp_server.starttls()
             smtp_server.login(EMAIL_HOST_USER, EMAIL_HOST_PASSWORD)
-            smtp_server.sendmail(EMAIL_SENDER, EMAIL_RECIPIENT, message.as_string())
-            smtp_server.quit(); logger.info(f"Email sent successfully to {EMAIL_RECIPIENT}"); return True
+            yield smtp_server
+        finally:
+            try: smtp_server.quit()
+            # Mail already handed over is delivered; a failed QUIT (incl. socket errors) must not turn into a send failure
+            except (smtplib.SMTPException, OSError): smtp_server.close() # Connection already dropped; just release the socket
+
+    def send_email(self, message: "EmailMessage", smtp=None):
+        import smtplib
+        if not message: logger.error("No message object provided to send_email."); return False
+        try:
+            # send_message flattens straight to bytes, skipping the as_string() round trip.
+            if smtp is not None:
+                smtp.send_message(message, from_addr=EMAIL_SENDER, to_addrs=EMAIL_RECIPIENT)
+            else:
+                with self.smtp_session() as smtp_server:
+                    smtp_server.send_message(message, from_addr=EMAIL_SENDER, to_addrs=EMAIL_RECIPIENT)
+            logger.info(f"Email sent successfully to {EMAIL_RECIPIENT}"); return True
         except smtplib.SMTPException as e_smtp: logger.error(f"SMTP error sending email: {e_smtp}", exc_info=True); return False
         except Exception as e: logger.error(f"General error sending email: {e}", exc_info=True); return False
 
+    async def send_email_async(self, message: "EmailMessage"):
+        # Non-blocking variant for async callers; aiosmtplib is optional and only needed here.
+        if not message: logger.error("No message object provided to send_email_async."); return False
+        try:
+            import aiosmtplib
+        except ImportError:
+            logger.error("aiosmtplib is not installed; cannot send email asynchronously. Use send_email instead.")
+            return False
+        try:
+            smtp_client = aiosmtplib.SMTP(hostname=EMAIL_HOST, port=EMAIL_PORT, timeout=30,
+                                          use_tls=EMAIL_PORT == 465, start_tls=EMAIL_USE_TLS and EMAIL_PORT != 465)
+            async with smtp_client:
+                await smtp_client.login(EMAIL_HOST_USER, EMAIL_HOST_PASSWORD)
+                await smtp_client.send_message(message, sender=EMAIL_SENDER, recipients=[EMAIL_RECIPIENT])
+            logger.info(f"Email sent successfully (async) to {EMAIL_RECIPIENT}"); return True
+        except aiosmtplib.SMTPException as e_smtp: logger.error(f"SMTP error sending email (async): {e_smtp}", exc_info=True); return False
+        except Exception as e: logger.error(f"General error sending email (async): {e}", exc_info=True); return False
+
+    async def send_emails_async(self, messages, max_concurrency=8):
+        import asyncio # Only the async batch path needs it; keeps the services package import cheap
+        # Bounded so a large batch doesn't trip the SMTP relay's connection/rate limits.
+        semaphore = asyncio.Semaphore(max_concurrency)
+
+        async def _send_bounded(message):
+            async with semaphore:
+                return await self.send_email_async(message)
+
+        return await asyncio.gather(*(_send_bounded(m) for m in messages))
+
+
 if __name__ == '__main__':
     logger.info("Starting email service test...")
     class MockStock: __init__ = lambda self, ticker, company_name, industry="Tech", sector="Software": setattr(self, 'ticker', ticker) or setattr(self, 'company_name', company_name) or setattr(self, 'industry', industry) or setattr(self, 'sector', sector)
@@ -1,55 +1,190 @@
 # services/ipo_analyzer/db_handler.py
-import time
+from sqlalchemy import select, or_, tuple_, func
+from sqlalchemy.dialects.postgresql import insert as pg_insert
 from database import IPO
 from core.logging_setup import logger
 from sqlalchemy.exc import SQLAlchemyError
 
+# Calendar fields copied onto the IPO row whenever the fetched value is present and differs
+IPO_FIELDS_TO_UPDATE = [
+    "company_name", "symbol", "ipo_date_str", "ipo_date",
+    "expected_price_range_low", "expected_price_range_high",
+    "offered_shares", "total_shares_value", "exchange", "status"
+]
 
-def get_or_create_ipo_db_entry(analyzer_instance, db_session, ipo_data_from_fetch):
+
+def _new_ipo_row(ipo_data_from_fetch, cik_to_store):
+    """Column values for a new IPO row."""
+    row = {field: ipo_data_from_fetch.get(field) for field in IPO_FIELDS_TO_UPDATE}  # ipo_date is the parsed date
+    row["cik"] = cik_to_store
+    return row
+
+
+def _new_ipo_entry(ipo_data_from_fetch, cik_to_store):
+    return IPO(**_new_ipo_row(ipo_data_from_fetch, cik_to_store))
+
+
+def _merge_fetched_ipo_row(row, ipo_data_from_fetch, cik_to_store):
+    """Same precedence as _apply_fetched_ipo_data, for a row that is still pending insert."""
+    for field in IPO_FIELDS_TO_UPDATE:
+        new_val = ipo_data_from_fetch.get(field)
+        if new_val is not None:
+            row[field] = new_val
+    if cik_to_store:
+        row["cik"] = cik_to_store
+
+
+def _upsert_new_ipo_rows(db_session, rows):
+    """
+    Inserts all new IPO rows with a single INSERT .. ON CONFLICT DO UPDATE .. RETURNING on PostgreSQL
+    (a row created concurrently by another run is updated instead of failing the batch).
+    Returns the new ids in row order. Other backends fall back to an ORM flush.
+    """
+    if db_session.get_bind().dialect.name != "postgresql":
+        entries = [IPO(**row) for row in rows]
+        db_session.add_all(entries)
+        db_session.flush()
+        return [entry.id for entry in entries]
+
+    insert_stmt = pg_insert(IPO).values(rows)
+    conflict_cols = ("company_name", "ipo_date_str", "symbol")
+    # Like the ORM update path, a NULL in the fetched data never overwrites a stored value
+    update_cols = {col: func.coalesce(insert_stmt.excluded[col], IPO.__table__.c[col])
+                   for col in rows[0] if col not in conflict_cols}
+    upsert_stmt = insert_stmt.on_conflict_do_update(
+        constraint="uq_ipo_name_date_symbol", set_=update_cols
+    ).returning(IPO.id, IPO.company_name, IPO.ipo_date_str, IPO.symbol)
+    ids_by_key = {(r.company_name, r.ipo_date_str, r.symbol): r.id for r in db_session.execute(upsert_stmt)}
+    return [ids_by_key.get((row["company_name"], row["ipo_date_str"], row["symbol"])) for row in rows]
+
+
+def _apply_fetched_ipo_data(ipo_db_entry, ipo_data_from_fetch, cik_to_store):
+    """Copies changed calendar fields (and a newly found CIK) onto an existing entry. Returns True if anything changed."""
+    updated = False
+    for field in IPO_FIELDS_TO_UPDATE:
+        new_val = ipo_data_from_fetch.get(field)
+        # Check if new_val is not None to avoid overwriting existing data with None
+        # Also check if the value has actually changed
+        if new_val is not None and getattr(ipo_db_entry, field) != new_val:
+            setattr(ipo_db_entry, field, new_val)
+            updated = True
+
+    # Update CIK if a new one was found and it's different or was missing
+    if cik_to_store and (ipo_db_entry.cik != cik_to_store or not ipo_db_entry.cik):
+        ipo_db_entry.cik = cik_to_store
+        updated = True
+    return updated
+
+
+def sync_ipo_db_entries(db_session, ipo_data_list):
+    """
+    Gets or creates the IPO rows for a whole batch of fetched IPOs with one lookup query and one commit.
+    On success each dict in ipo_data_list gets an "ipo_db_id" key, which get_or_create_ipo_db_entry
+    then resolves by primary key instead of repeating the per-IPO lookups.
+    """
+    symbols = {d["symbol"] for d in ipo_data_list if d.get("symbol")}
+    name_date_pairs = {(d["company_name"], d["ipo_date_str"]) for d in ipo_data_list
+                       if d.get("company_name") and d.get("ipo_date_str")}
+    match_conditions = []
+    if symbols:
+        match_conditions.append(IPO.symbol.in_(symbols))
+    if name_date_pairs:
+        match_conditions.append(tuple_(IPO.company_name, IPO.ipo_date_str).in_(name_date_pairs))
+
+    try:
+        existing_entries = db_session.execute(
+            select(IPO).where(or_(*match_conditions))).scalars().all() if match_conditions else []
+    except SQLAlchemyError as e:
+        db_session.rollback()
+        logger.error(f"Error loading existing IPO entries for batch sync: {e}", exc_info=True)
+        return False
+
+    by_symbol, by_name_date = {}, {}
+    for entry in existing_entries:
+        if entry.symbol:
+            by_symbol.setdefault(entry.symbol, entry)
+        by_name_date.setdefault((entry.company_name, entry.ipo_date_str), entry)
+
+    synced_entries = []  # (ipo_data, IPO entry) for rows that already exist
+    new_rows, new_row_ipo_data = [], []  # Column dicts pending insert, and the fetched IPOs resolving to each
+    updated_count = 0
+    for ipo_data in ipo_data_list:
+        # Same precedence as the single-row path: symbol first, then company name + original date string
+        ipo_db_entry = by_symbol.get(ipo_data.get("symbol")) if ipo_data.get("symbol") else None
+        if ipo_db_entry is None:
+            ipo_db_entry = by_name_date.get((ipo_data.get("company_name"), ipo_data.get("ipo_date_str")))
+
+        # Only a CIK that came with the fetched data is stored here; the ticker lookup is deferred to
+        # fetch_s1_filing_data, so IPOs whose recent analysis is still valid never touch SEC EDGAR.
+        cik_to_store = ipo_data.get("cik")
+        if isinstance(ipo_db_entry, int):  # Index of a row created earlier in this batch
+            _merge_fetched_ipo_row(new_rows[ipo_db_entry], ipo_data, cik_to_store)
+            new_row_ipo_data[ipo_db_entry].append(ipo_data)
+            continue
+
+        if not ipo_db_entry:
+            new_row = _new_ipo_row(ipo_data, cik_to_store)
+            # Register so later duplicates in the same batch resolve to this row
+            if new_row["symbol"]:
+                by_symbol[new_row["symbol"]] = len(new_rows)
+            by_name_date[(new_row["company_name"], new_row["ipo_date_str"])] = len(new_rows)
+            new_rows.append(new_row)
+            new_row_ipo_data.append([ipo_data])
+            continue
+        if _apply_fetched_ipo_data(ipo_db_entry, ipo_data, cik_to_store):
+            updated_count += 1
+        synced_entries.append((ipo_data, ipo_db_entry))
+
+    try:
+        db_session.flush()  # Pending updates to existing rows; read ids before commit expires the instances
+        synced_ids = [(ipo_data, entry.id) for ipo_data, entry in synced_entries]
+        if new_rows:
+            for ipo_data_group, new_id in zip(new_row_ipo_data, _upsert_new_ipo_rows(db_session, new_rows)):
+                synced_ids.extend((ipo_data, new_id) for ipo_data in ipo_data_group)
+        db_session.commit()
+    except SQLAlchemyError as e:
+        db_session.rollback()
+        logger.error(f"Error committing batch IPO sync ({len(ipo_data_list)} IPOs): {e}", exc_info=True)
+        return False
+
+    for ipo_data, ipo_db_id in synced_ids:
+        ipo_data["ipo_db_id"] = ipo_db_id
+    logger.info(f"Synced {len(synced_ids)} IPO entries in one batch ({len(new_rows)} created, {updated_count} updated).")
+    return True
+
+
+def get_or_create_ipo_db_entry(db_session, ipo_data_from_fetch):
     """Gets an existing IPO entry from the DB or creates a new one."""
+    # Fast path: the row was already created/updated by sync_ipo_db_entries for this run
+    ipo_db_id = ipo_data_from_fetch.get("ipo_db_id")
+    if ipo_db_id is not None:
+        ipo_db_entry = db_session.get(IPO, ipo_db_id)
+        if ipo_db_entry:
+            return ipo_db_entry
+
     ipo_db_entry = None
 
     # Try to find by symbol first, as it's more likely to be unique if present
     if ipo_data_from_fetch.get("symbol"):
-        ipo_db_entry = db_session.query(IPO).filter(IPO.symbol == ipo_data_from_fetch["symbol"]).first()
+        ipo_db_entry = db_session.execute(
+            select(IPO).where(IPO.symbol == ipo_data_from_fetch["symbol"]).limit(1)).scalars().first()
 
     # If not found by symbol, try by company name and IPO date string (original date string)
     if not ipo_db_entry and ipo_data_from_fetch.get("company_name") and ipo_data_from_fetch.get("ipo_date_str"):
-        ipo_db_entry = db_session.query(IPO).filter(
+        ipo_db_entry = db_session.execute(select(IPO).where(
             IPO.company_name == ipo_data_from_fetch["company_name"],
             IPO.ipo_date_str == ipo_data_from_fetch["ipo_date_str"]  # Match on the original string
-        ).first()
-
-    # Try to get CIK if not already available
-    cik_to_store = ipo_data_from_fetch.get("cik")  # CIK might come from data fetch
-    if not cik_to_store and ipo_data_from_fetch.get("symbol"):
-        # If no CIK from fetched data, try to get it using symbol
-        cik_to_store = analyzer_instance.sec_edgar.get_cik_by_ticker(ipo_data_from_fetch["symbol"])
-        time.sleep(0.5)  # SEC EDGAR rate limiting
-    elif not cik_to_store and ipo_db_entry and ipo_db_entry.symbol and not ipo_db_entry.cik:
-        # If DB entry exists but has no CIK, try to get it
-        cik_to_store = analyzer_instance.sec_edgar.get_cik_by_ticker(ipo_db_entry.symbol)
-        time.sleep(0.5)
+        ).limit(1)).scalars().first()
+
+    # CIK lookup by ticker is deferred to fetch_s1_filing_data; only a CIK from the fetched data is stored here
+    cik_to_store = ipo_data_from_fetch.get("cik")
 
     if not ipo_db_entry:
         logger.info(f"IPO '{ipo_data_from_fetch.get('company_name')}' not found in DB, creating new entry.")
-        ipo_db_entry = IPO(
-            company_name=ipo_data_from_fetch.get("company_name"),
-            symbol=ipo_data_from_fetch.get("symbol"),
-            ipo_date_str=ipo_data_from_fetch.get("ipo_date_str"),
-            ipo_date=ipo_data_from_fetch.get("ipo_date"),  # Parsed date
-            expected_price_range_low=ipo_data_from_fetch.get("expected_price_range_low"),
-            expected_price_range_high=ipo_data_from_fetch.get("expected_price_range_high"),
-            offered_shares=ipo_data_from_fetch.get("offered_shares"),
-            total_shares_value=ipo_data_from_fetch.get("total_shares_value"),
-            exchange=ipo_data_from_fetch.get("exchange"),
-            status=ipo_data_from_fetch.get("status"),
-            cik=cik_to_store
-        )
+        ipo_db_entry = _new_ipo_entry(ipo_data_from_fetch, cik_to_store)
         db_session.add(ipo_db_entry)
         try:
             db_session.commit()
-            db_session.refresh(ipo_db_entry)  # To get ID and other defaults
             logger.info(
                 f"Created IPO entry for '{ipo_db_entry.company_name}' (ID: {ipo_db_entry.id}, CIK: {ipo_db_entry.cik})")
         except SQLAlchemyError as e:
@@ -59,33 +194,13 @@ def get_or_create_ipo_db_entry(analyzer_instance, db_session, ipo_data_from_fetc
             return None  # Return None if creation fails
     else:
         # IPO entry exists, update it if necessary
-        updated = False
-        fields_to_update = [
-            "company_name", "symbol", "ipo_date_str", "ipo_date",
-            "expected_price_range_low", "expected_price_range_high",
-            "offered_shares", "total_shares_value", "exchange", "status"
-        ]
-        for field in fields_to_update:
-            new_val = ipo_data_from_fetch.get(field)
-            # Check if new_val is not None to avoid overwriting existing data with None
-            # Also check if the value has actually changed
-            if new_val is not None and getattr(ipo_db_entry, field) != new_val:
-                setattr(ipo_db_entry, field, new_val)
-                updated = True
-
-        # Update CIK if a new one was found and it's different or was missing
-        if cik_to_store and (ipo_db_entry.cik != cik_to_store or not ipo_db_entry.cik):
-            ipo_db_entry.cik = cik_to_store
-            updated = True
-
-        if updated:
+        if _apply_fetched_ipo_data(ipo_db_entry, ipo_data_from_fetch, cik_to_store):
             try:
                 db_session.commit()
-                db_session.refresh(ipo_db_entry)
                 logger.info(f"Updated IPO entry for '{ipo_db_entry.company_name}' (ID: {ipo_db_entry.id}).")
             except SQLAlchemyError as e:
                 db_session.rollback()
                 logger.error(f"Error updating IPO DB entry for '{ipo_db_entry.company_name}': {e}", exc_info=True)
                 # Potentially return the existing, un-updated entry or None depending on desired behavior
 
-    return ipo_db_entry
\ No newline at end of file
+    return ipo_db_entry
@@ -1,13 +1,37 @@
 # services/ipo_analyzer/helpers.py
+import re
+from datetime import date
 from dateutil import parser as date_parser
 from core.logging_setup import logger
 
+# Finnhub IPO "price": "15", "10.0-12.0", "$10 - $12"
+_PRICE_RANGE_RE = re.compile(r"^\s*\$?(\d+(?:\.\d+)?)\s*(?:-\s*(?:\$?(\d+(?:\.\d+)?))?)?\s*$")
+
 def parse_ipo_date_string(date_str):
     if not date_str:
         return None
+    try:
+        # Finnhub sends YYYY-MM-DD: parse that in C, only falling back to the (much slower) flexible parser
+        return date.fromisoformat(date_str)
+    except (ValueError, TypeError):
+        pass
     try:
         # date_parser is quite flexible
         return date_parser.parse(date_str).date()
     except (ValueError, TypeError) as e:
         logger.warning(f"Could not parse IPO date string '{date_str}': {e}")
-        return None
\ No newline at end of file
+        return None
+
+
+def parse_ipo_price_range(price_raw):
+    """Returns (low, high) floats for a Finnhub price value; a single price gives low == high."""
+    if isinstance(price_raw, (float, int)):  # If it's just a number
+        return float(price_raw), float(price_raw)
+    if not isinstance(price_raw, str) or not price_raw.strip():
+        return None, None
+    match = _PRICE_RANGE_RE.match(price_raw)
+    if not match:
+        logger.debug(f"Unrecognized IPO price format: '{price_raw}'")
+        return None, None
+    price_low = float(match.group(1))
+    return price_low, float(match.group(2)) if match.group(2) else price_low
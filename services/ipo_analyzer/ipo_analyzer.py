@@ -1,9 +1,9 @@
 # services/ipo_analyzer/ipo_analyzer.py
 # services/ipo_analyzer/ipo_analyzer.py
-import time
-from sqlalchemy import inspect as sa_inspect
+from sqlalchemy import select
 from datetime import datetime, timedelta, timezone
 import concurrent.futures
+import queue
 
 from api_clients import FinnhubClient, GeminiAPIClient, SECEDGARClient
 from database import SessionLocal, IPO, IPOAnalysis  # Removed get_db_session, manage session per thread
@@ -12,12 +12,12 @@ from sqlalchemy.exc import SQLAlchemyError
 from core.config import IPO_ANALYSIS_REANALYZE_DAYS
 
 # Import functions from submodules
-from .helpers import parse_ipo_date_string
+from .helpers import parse_ipo_date_string, parse_ipo_price_range
 from .data_fetcher import fetch_upcoming_ipo_data, fetch_s1_filing_data
-from .db_handler import get_or_create_ipo_db_entry
+from .db_handler import get_or_create_ipo_db_entry, sync_ipo_db_entries
 from .ai_analyzer import perform_ai_analysis_for_ipo
 
-MAX_IPO_ANALYSIS_WORKERS = 1  # Module-level constant, adjust as needed based on API limits and system resources
+MAX_IPO_ANALYSIS_WORKERS = 4  # API budgets are enforced by the shared limiters in api_clients/rate_limiter.py
 
 
 class IPOAnalyzer:
@@ -36,7 +36,7 @@ class IPOAnalyzer:
         logger.info(
             f"Task: Starting analysis for IPO: {ipo_identifier} from source {ipo_data_from_fetch.get('source_api')}")
 
-        ipo_db_entry = get_or_create_ipo_db_entry(self, db_session, ipo_data_from_fetch)
+        ipo_db_entry = get_or_create_ipo_db_entry(db_session, ipo_data_from_fetch)
         if not ipo_db_entry:
             logger.error(
                 f"Task: Could not get/create DB entry for IPO {ipo_identifier}. Aborting analysis for this item.")
@@ -44,26 +44,21 @@ class IPOAnalyzer:
 
         # Check if recent analysis exists and if significant data has changed
         reanalyze_threshold = datetime.now(timezone.utc) - timedelta(days=IPO_ANALYSIS_REANALYZE_DAYS)
-        existing_analysis = db_session.query(IPOAnalysis).filter(IPOAnalysis.ipo_id == ipo_db_entry.id).order_by(
-            IPOAnalysis.analysis_date.desc()).first()
+        existing_analysis = db_session.execute(
+            select(IPOAnalysis).where(IPOAnalysis.ipo_id == ipo_db_entry.id)
+            .order_by(IPOAnalysis.analysis_date.desc()).limit(1)).scalars().first()
 
         significant_change_detected = False
         if existing_analysis and existing_analysis.key_data_snapshot:
             snap = existing_analysis.key_data_snapshot
             snap_parsed_date = parse_ipo_date_string(snap.get("date"))
+            snap_price_low, snap_price_high = parse_ipo_price_range(snap.get("price"))
 
             # Compare key fields for significant changes
             if (ipo_db_entry.ipo_date != snap_parsed_date or
                     ipo_db_entry.status != snap.get("status") or
-                    ipo_db_entry.expected_price_range_low != (
-                            parse_ipo_date_string(snap.get("price").split('-')[0]) if isinstance(snap.get("price"),
-                                                                                                 str) and '-' in snap.get(
-                                "price") else snap.get("price")) or
-                    # Crude price parsing for snapshot; assumes a simple number or "low-high"
-                    ipo_db_entry.expected_price_range_high != (
-                            parse_ipo_date_string(snap.get("price").split('-')[1]) if isinstance(snap.get("price"),
-                                                                                                 str) and '-' in snap.get(
-                                "price") and len(snap.get("price").split('-')) > 1 else snap.get("price"))):
+                    ipo_db_entry.expected_price_range_low != snap_price_low or
+                    ipo_db_entry.expected_price_range_high != snap_price_high):
                 significant_change_detected = True
                 logger.info(f"Task: Significant data change detected for {ipo_identifier}. Re-analyzing.")
 
@@ -174,32 +169,54 @@ class IPOAnalyzer:
             logger.info(
                 f"No limit set for max_to_analyze, proceeding with {len(relevant_ipos_to_process)} relevant IPOs.")
 
-        with concurrent.futures.ThreadPoolExecutor(max_workers=MAX_IPO_ANALYSIS_WORKERS) as executor:
-            future_to_ipo_data = {}
-            for ipo_data_for_task in relevant_ipos_to_process:  # Use the filtered list
-                future = executor.submit(self._thread_worker_analyze_ipo, ipo_data_for_task)
-                future_to_ipo_data[future] = ipo_data_for_task.get("company_name", "Unknown IPO")
-
-            for future in concurrent.futures.as_completed(future_to_ipo_data):
-                ipo_name = future_to_ipo_data[future]
+        # 5. Create/update all IPO rows up front in one query + one commit, instead of per task.
+        #    If this fails, tasks fall back to the per-IPO lookup in get_or_create_ipo_db_entry.
+        sync_session = SessionLocal()
+        try:
+            sync_ipo_db_entries(sync_session, relevant_ipos_to_process)
+        finally:
+            sync_session.close()
+
+        # Each worker drains a shared queue with a single DB session, so a run costs one session per worker
+        # (not per IPO) while IPOs are still handed out as workers free up.
+        ipo_queue = queue.Queue()
+        for ipo_data_for_task in relevant_ipos_to_process:  # Use the filtered list
+            ipo_queue.put(ipo_data_for_task)
+        num_workers = min(MAX_IPO_ANALYSIS_WORKERS, len(relevant_ipos_to_process))
+        with concurrent.futures.ThreadPoolExecutor(max_workers=num_workers) as executor:
+            worker_futures = [executor.submit(self._thread_worker_analyze_ipos, ipo_queue) for _ in range(num_workers)]
+            for future in concurrent.futures.as_completed(worker_futures):
                 try:
-                    result = future.result()
-                    if result:
-                        analyzed_results.append(result)
+                    analyzed_results.extend(future.result())
                 except Exception as exc:
-                    logger.error(f"IPO analysis for '{ipo_name}' generated an exception in thread: {exc}",
-                                 exc_info=True)
+                    logger.error(f"IPO analysis worker generated an exception in thread: {exc}", exc_info=True)
 
         logger.info(
             f"IPO analysis pipeline completed. Processed {len(analyzed_results)} IPOs that required new/updated analysis from the filtered set.")
         return analyzed_results
 
-    def _thread_worker_analyze_ipo(self, ipo_data_from_fetch):
+    def _thread_worker_analyze_ipos(self, ipo_queue):
         """
-        Worker function for each thread. Manages its own DB session.
+        Worker function for each thread. Analyzes IPOs from the shared queue until it is empty,
+        reusing one DB session for all of them. Returns the analyses produced by this worker.
         """
         db_session = SessionLocal()
+        worker_results = []
         try:
-            return self._analyze_single_ipo_task(db_session, ipo_data_from_fetch)
+            while True:
+                try:
+                    ipo_data_from_fetch = ipo_queue.get_nowait()
+                except queue.Empty:
+                    break
+                try:
+                    result = self._analyze_single_ipo_task(db_session, ipo_data_from_fetch)
+                    if result:
+                        worker_results.append(result)
+                except Exception as exc:
+                    db_session.rollback()  # Leave the shared session usable for the next IPO
+                    logger.error(
+                        f"IPO analysis for '{ipo_data_from_fetch.get('company_name', 'Unknown IPO')}' generated an exception in thread: {exc}",
+                        exc_info=True)
+            return worker_results
         finally:
-            SessionLocal.remove()
\ No newline at end of file
+            SessionLocal.remove()
@@ -1,5 +1,4 @@
 # services/news_analyzer/ai_analyzer.py
-import time
 import json
 from core.logging_setup import logger
 from core.config import NEWS_ARTICLE_MAX_LENGTH_FOR_GEMINI_SUMMARIZATION, AI_JSON_OUTPUT_INSTRUCTION
@@ -37,7 +36,6 @@ def perform_ai_analysis_for_news_item(analyzer_instance, news_event_db_obj):
         f"{AI_JSON_OUTPUT_INSTRUCTION} Structure it as: {sentiment_json_structure}"
     )
     sentiment_response_data = analyzer_instance.gemini.generate_text(sentiment_prompt, output_format="json")
-    time.sleep(1)
 
     if isinstance(sentiment_response_data, dict) and not sentiment_response_data.get("error"):
         analysis_payload["sentiment"] = sentiment_response_data.get("sentiment", "Error Parsing")
@@ -73,7 +71,6 @@ def perform_ai_analysis_for_news_item(analyzer_instance, news_event_db_obj):
     )
     impact_analysis_response_data = analyzer_instance.gemini.generate_text(prompt_detailed_analysis,
                                                                            output_format="json")
-    time.sleep(1)
 
     if isinstance(impact_analysis_response_data, dict) and not impact_analysis_response_data.get("error"):
         analysis_payload["news_summary_detailed"] = impact_analysis_response_data.get("newsSummary", "AI Error")
@@ -1,5 +1,4 @@
 # services/news_analyzer/news_analyzer.py
-import time
 from datetime import datetime, timezone, timedelta
 from database import SessionLocal, get_db_session, NewsEventAnalysis
 from core.logging_setup import logger
@@ -160,7 +159,6 @@ class NewsAnalyzer:
                         if analysis_result:
                             analyzed_news_results.append(analysis_result)
                             newly_analyzed_count_this_run += 1
-                        time.sleep(3)  # Delay between AI calls if multiple items are analyzed
 
                 except Exception as e_item:  # Catch errors for a single item processing
                     logger.error(
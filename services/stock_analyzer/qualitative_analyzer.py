@@ -2,7 +2,6 @@
 import time
 import json
 from core.logging_setup import logger
-from api_clients import extract_S1_text_sections
 from core.config import (
     TEN_K_KEY_SECTIONS, SUMMARIZATION_CHUNK_SIZE_CHARS,
     SUMMARIZATION_CHUNK_OVERLAP_CHARS, SUMMARIZATION_MAX_CONCAT_SUMMARIES_CHARS,
@@ -10,6 +9,8 @@ from core.config import (
 )
 from .helpers import safe_get_float
 
+TEN_K_FORM_TYPES_BY_PRIORITY = ("10-K", "10-K/A")
+
 
 def _summarize_text_chunked_for_json(analyzer_instance, text_to_summarize, base_context, section_specific_instruction,
                                      company_name_ticker_prompt, json_structure_example):
@@ -36,7 +37,6 @@ def _summarize_text_chunked_for_json(analyzer_instance, text_to_summarize, base_
             f"Text to Summarize from '{base_context}' for {company_name_ticker_prompt}:\n\"\"\"\n{text_to_summarize}\n\"\"\"\n\n{final_prompt_instruction}",
             output_format="json"
         )
-        time.sleep(2)
         if isinstance(summary_json, dict) and not summary_json.get("error"):
             return summary_json, text_len
         else:
@@ -63,7 +63,6 @@ def _summarize_text_chunked_for_json(analyzer_instance, text_to_summarize, base_
             f"Concisely summarize the key information in this chunk relevant to: {section_specific_instruction.splitlines()[0]}"
             # Simpler instruction for chunk
         )  # output_format="text" by default
-        time.sleep(2)
         chunk_summaries_text.append(chunk_summary_text if chunk_summary_text and not chunk_summary_text.startswith(
             "Error:") else f"[AI error or no content for chunk {i + 1}]")
 
@@ -85,7 +84,6 @@ def _summarize_text_chunked_for_json(analyzer_instance, text_to_summarize, base_
         f"Synthesize these into a single, cohesive overview for '{base_context}'.\n{final_prompt_instruction}",
         output_format="json"
     )
-    time.sleep(2)
 
     if isinstance(final_summary_json, dict) and not final_summary_json.get("error"):
         return final_summary_json, text_len
@@ -119,12 +117,8 @@ def fetch_and_summarize_10k_data(analyzer_instance):
             summary_results[key] = {"error": "No CIK available for 10-K fetching."}
         return summary_results
 
-    filing_url = analyzer_instance.sec_edgar.get_filing_document_url(analyzer_instance.stock_db_entry.cik, "10-K")
-    time.sleep(0.5)
-    if not filing_url:
-        logger.info(f"No recent 10-K found for {ticker}, trying 10-K/A.")
-        filing_url = analyzer_instance.sec_edgar.get_filing_document_url(analyzer_instance.stock_db_entry.cik, "10-K/A")
-        time.sleep(0.5)
+    # 10-K preferred, 10-K/A as fallback, resolved in one pass over the submissions
+    filing_url = analyzer_instance.sec_edgar.get_filing_document_url(analyzer_instance.stock_db_entry.cik, TEN_K_FORM_TYPES_BY_PRIORITY)
 
     if not filing_url:
         logger.warning(f"No 10-K or 10-K/A URL found for {ticker} (CIK: {analyzer_instance.stock_db_entry.cik})")
@@ -142,7 +136,7 @@ def fetch_and_summarize_10k_data(analyzer_instance):
         return summary_results
 
     logger.info(f"Fetched 10-K text (length: {len(text_content)}) for {ticker}. Extracting and summarizing sections.")
-    sections = extract_S1_text_sections(text_content, TEN_K_KEY_SECTIONS)
+    sections = analyzer_instance.sec_edgar.get_filing_sections(text_content, TEN_K_KEY_SECTIONS, source_url=filing_url)
     company_name_for_prompt = analyzer_instance.stock_db_entry.company_name or ticker
 
     # Define JSON structure for basic summaries
@@ -194,7 +188,6 @@ def fetch_and_summarize_10k_data(analyzer_instance):
             f"Provide your analysis as a JSON object. {AI_JSON_OUTPUT_INSTRUCTION} Structure it as: {moat_json_structure}"
         )
         moat_summary_json = analyzer_instance.gemini.generate_text(moat_prompt, output_format="json")
-        time.sleep(3)
         summary_results["economic_moat_summary_data"] = moat_summary_json if isinstance(moat_summary_json, dict) else {
             "error": "AI analysis for economic moat failed or returned non-JSON."}
     else:
@@ -220,7 +213,6 @@ def fetch_and_summarize_10k_data(analyzer_instance):
             f"{AI_JSON_OUTPUT_INSTRUCTION} Structure it as: {industry_json_structure}"
         )
         industry_summary_json = analyzer_instance.gemini.generate_text(industry_prompt, output_format="json")
-        time.sleep(3)
         summary_results["industry_trends_summary_data"] = industry_summary_json if isinstance(industry_summary_json,
                                                                                               dict) else {
             "error": "AI analysis for industry trends failed or returned non-JSON."}
@@ -356,7 +348,6 @@ def fetch_and_analyze_competitors(analyzer_instance):
     )
 
     comp_summary_json = analyzer_instance.gemini.generate_text(comp_prompt, output_format="json")
-    time.sleep(3)
 
     final_competitor_analysis_data = {**default_error_summary, "peers_data": peer_details_list}  # Start with default
 